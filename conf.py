@@ -6,13 +6,43 @@ config.read('./conf.txt')
 RAY_PEN_WIDTH = config.getint('DEFAULT', 'RAY_PEN_WIDTH', fallback=5)
 RAY_MAX_LENGTH = config.getint('DEFAULT', 'RAY_MAX_LENGTH', fallback=500)
 
+# Segments traced per laser ray besides the first one, brightest branches first, see optics/RayQueue.py
 MAX_REFRACTIONS = config.getint('DEFAULT', 'MAX_REFRACTIONS', fallback=10)
+# Rays dimmer than this alpha (0-255) are not traced
+MIN_RAY_ALPHA = config.getfloat('DEFAULT', 'MIN_RAY_ALPHA', fallback=5)
+# Rays dimmer than this alpha survive with probability alpha / ROULETTE_ALPHA at alpha ROULETTE_ALPHA, 0 disables it
+ROULETTE_ALPHA = config.getfloat('DEFAULT', 'ROULETTE_ALPHA', fallback=0)
+# Time [ms] the rays of one laser may be traced for, 0 for no limit
+TRACE_TIME_BUDGET = config.getfloat('DEFAULT', 'TRACE_TIME_BUDGET', fallback=0)
+# Memory [MB] of traced paths kept for unchanged lasers and scenes, 0 disables the cache, see optics/TraceCache.py
+TRACE_CACHE_SIZE = config.getfloat('DEFAULT', 'TRACE_CACHE_SIZE', fallback=64)
+# Directory the cached paths are also written to, so they survive restarts, empty keeps them in memory only
+TRACE_CACHE_DIR = config.get('DEFAULT', 'TRACE_CACHE_DIR', fallback='')
 ROUNDING_PRECISION = config.getint('DEFAULT', 'ROUNDING_PRECISION', fallback=2)
 
+# Tracing engine: "sympy" (exact symbolic geometry) or "numeric" (float arithmetic)
+SOLVER_ENGINE = config.get('DEFAULT', 'SOLVER_ENGINE', fallback='sympy')
+# Number of worker processes tracing lasers in parallel, 0 traces them one by one on the GUI thread
+PARALLEL_WORKERS = config.getint('DEFAULT', 'PARALLEL_WORKERS', fallback=0)
+# Trace on a background thread pool instead of blocking the GUI thread
+BACKGROUND_TRACING = config.getboolean('DEFAULT', 'BACKGROUND_TRACING', fallback=True)
+
 LEN_NORMAL_POINTS_DISTANCE = config.getfloat('DEFAULT', 'LEN_NORMAL_POINTS_DISTANCE', fallback=0.5)
 
-REFRESH_LASER_TIMEOUT = config.getint('DEFAULT', 'REFRESH_LASER_TIMEOUT', fallback=2000)
-REFRESH_OBJ_TIMEOUT = config.getint('DEFAULT', 'REFRESH_OBJ_TIMEOUT', fallback=2000)
+# Debug event levels per module, e.g. "solver=debug,lens=info" or "*=debug", see optics/TraceLog.py
+TRACE_LOG = config.get('DEFAULT', 'TRACE_LOG', fallback='')
+# JSON Lines file receiving all enabled debug events, empty keeps them in memory only
+TRACE_LOG_FILE = config.get('DEFAULT', 'TRACE_LOG_FILE', fallback='')
+# Number of debug events kept in memory
+TRACE_LOG_SIZE = config.getint('DEFAULT', 'TRACE_LOG_SIZE', fallback=10000)
+
+# Time refresh stages and show them in an overlay of the view, toggled with P, see optics/Profiler.py
+PROFILING = config.getboolean('DEFAULT', 'PROFILING', fallback=False)
+
+# Time [ms] a recalculation may take while items are dragged, slower scenes are traced as a preview
+FRAME_BUDGET = config.getint('DEFAULT', 'FRAME_BUDGET', fallback=16)
+# Longest delay [ms] between recalculations, also the idle time before previews are refined
+MAX_REFRESH_INTERVAL = config.getint('DEFAULT', 'MAX_REFRESH_INTERVAL', fallback=500)
 
 IS_REFLECTION = config.getboolean('DEFAULT', 'IS_REFLECTION', fallback=True)
 IS_REFRACTION = config.getboolean('DEFAULT', 'IS_REFRACTION', fallback=True)
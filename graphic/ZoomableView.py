@@ -1,14 +1,18 @@
 import math
-from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QPainter, QKeyEvent, QMouseEvent, QWheelEvent
+from PyQt6.QtCore import Qt, QRectF
+from PyQt6.QtGui import QPainter, QKeyEvent, QMouseEvent, QWheelEvent, QPaintEvent, QColor, QFont, QFontMetrics
 from PyQt6.QtWidgets import QGraphicsView, QGraphicsScene, QGraphicsItem
 from graphic.base import SceneItem
 from graphic.config import FONT_SIZE
+from optics.Profiler import Profiler
 
 
 class ZoomableView(QGraphicsView):
     """Zoomable view with panning and scalability toggling."""
 
+    # Stages listed in the profiler overlay, in refresh order
+    PROFILER_STAGES = ("update_props", "trace", "collision", "reflect_refract", "convert", "paint")
+
     def __init__(self, scene: QGraphicsScene):
         """
         Initialize the ZoomableView.
@@ -32,6 +36,10 @@ class ZoomableView(QGraphicsView):
         self.start_rotation = None
         self.origin_pos = None
 
+        self.profiler_overlay = False
+        if Profiler.enabled:
+            self.toggle_profiler()
+
     def keyPressEvent(self, event: QKeyEvent):
         """
         Handle key press events for toggling scalability, moving, and rotation modes.
@@ -49,6 +57,55 @@ class ZoomableView(QGraphicsView):
 
             print("Rotation mode:", "ON" if self.rotation_mode else "OFF")
 
+        elif event.key() == Qt.Key.Key_P:  # Toggle the profiler and its overlay
+            self.toggle_profiler()
+
+    def paintEvent(self, event: QPaintEvent):
+        """
+        Paint the scene, timed as the `frame` stage of the profiler.
+
+        :param event: QPaintEvent - The paint event.
+        """
+        with Profiler.stage("frame"):
+            super().paintEvent(event)
+        if Profiler.enabled:
+            Profiler.frame()
+
+    def drawForeground(self, painter: QPainter, rect: QRectF):
+        """
+        Draw the profiler overlay over the scene when it is shown.
+
+        :param painter: QPainter - The painter of the viewport.
+        :param rect: QRectF - The exposed scene rectangle.
+        """
+        super().drawForeground(painter, rect)
+        if self.profiler_overlay:
+            self.draw_profiler_overlay(painter)
+
+    def draw_profiler_overlay(self, painter: QPainter):
+        """Draw the stage times and counters of the last frame in the top left corner of the viewport."""
+        stats = Profiler.last
+        lines = [f"{'frame':<16}{stats.get('frame', 0):8.2f} ms"]
+        lines += [f"{name:<16}{stats[name]:8.2f} ms" for name in self.PROFILER_STAGES if name in stats]
+        lines += [f"{'rays':<16}{int(stats.get('rays', 0)):8d}",
+                  f"{'bounces':<16}{int(stats.get('bounces', 0)):8d}",
+                  f"{'tests':<16}{int(stats.get('intersection_tests', 0)):8d}"]
+
+        font = QFont("monospace", 9)
+        font.setStyleHint(QFont.StyleHint.Monospace)
+        metrics = QFontMetrics(font)
+        line_height = metrics.height()
+        width = max(metrics.horizontalAdvance(line) for line in lines) + 12
+
+        painter.save()
+        painter.resetTransform()  # Draw in viewport coordinates, independent of zoom and panning
+        painter.setFont(font)
+        painter.fillRect(QRectF(4, 4, width, line_height * len(lines) + 8), QColor(0, 0, 0, 160))
+        painter.setPen(QColor(255, 255, 255))
+        for i, line in enumerate(lines):
+            painter.drawText(10, 8 + metrics.ascent() + i * line_height, line)
+        painter.restore()
+
     def mouseDoubleClickEvent(self, event: QMouseEvent):
         print(self.mapToScene(event.pos()))
         super().mouseDoubleClickEvent(event)
@@ -217,6 +274,16 @@ class ZoomableView(QGraphicsView):
         # else:
         #     self.disable_items_scaling()
 
+    def toggle_profiler(self):
+        """Toggle the profiler together with its overlay."""
+        self.profiler_overlay = not self.profiler_overlay
+        Profiler.enabled = self.profiler_overlay
+        Profiler.reset()
+        # The overlay stays in the corner of the viewport, so every repaint has to redraw it
+        self.setViewportUpdateMode(QGraphicsView.ViewportUpdateMode.FullViewportUpdate if self.profiler_overlay
+                                   else QGraphicsView.ViewportUpdateMode.MinimalViewportUpdate)
+        self.viewport().update()
+
     def toggle_items_rotation(self):
         """Toggle the rotation mode for items."""
         self.rotation_mode = not self.rotation_mode
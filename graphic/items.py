@@ -1,12 +1,18 @@
+import numpy as np
 from PyQt6.QtCore import QRectF, Qt, QPointF
-from PyQt6.QtGui import QLinearGradient, QColor, QBrush, QPen, QPainter, QPainterPath, QPolygonF
+from PyQt6.QtGui import QLinearGradient, QColor, QBrush, QPen, QPainter, QPainterPath, QPainterPathStroker, QPolygonF
 from PyQt6.QtWidgets import QGraphicsEllipseItem, QGraphicsRectItem, QGraphicsItem
 from sympy import pi, cos, sin
 from graphic.base import SceneItem
 from graphic.ZoomableView import ZoomableView
 from conf import RAY_MAX_LENGTH, RAY_PEN_WIDTH
+from optics.Profiler import Profiler
+from optics.RayPath import RayPath
+from optics.TraceLog import TraceLog
 from optics.util import round_point
 
+log = TraceLog.channel("render")
+
 
 class EllipseItem(QGraphicsEllipseItem, SceneItem):
     """
@@ -184,6 +190,11 @@ class RayGraphicItem(QGraphicsItem):
     Inherits from QGraphicsItem.
     """
 
+    # Traced segments are drawn with one path per alpha bucket, alphas are rounded to multiples of this step
+    ALPHA_STEP = 8
+    # Wavelengths [nm] are rounded to multiples of this step when segments are grouped by color
+    WAVELENGTH_STEP = 10
+
     def __init__(self, start_point: QPointF, view: ZoomableView, parent=None):
         """
         Initialize the LineItem.
@@ -198,7 +209,15 @@ class RayGraphicItem(QGraphicsItem):
         self.setZValue(1)
         self.pen_width = RAY_PEN_WIDTH
         self._inf_point = None
-        self._path_points: list[dict[str, QPointF]] = []
+        self._segments = np.empty((0, RayPath.FIELDS))  # Rows start_x, start_y, end_x, end_y, alpha
+        self._wavelengths = np.empty(0)  # Wavelength of every segment, 0 for rays without one
+        self._batches: list[tuple[QPen, QPainterPath]] = []  # Pen and path of every alpha bucket, dimmest first
+        self._bounds = QRectF()  # Extents of the traced segments including the pen width
+        # Geometry derived from the laser, computed on first use and dropped when the laser moves
+        self._cached_start_point = None
+        self._cached_inf_point = None
+        self._line_bounds = None
+        self._shape = None
         self.view = view
         self.view.scene().addItem(self)
 
@@ -216,61 +235,157 @@ class RayGraphicItem(QGraphicsItem):
             pass
 
     def boundingRect(self):
-        rect = QRectF(self.start_point, self.inf_point).normalized()
-        return rect.adjusted(-self.pen_width, -self.pen_width, self.pen_width, self.pen_width)
+        if self._batches:
+            return self._bounds
+        if self._line_bounds is None:
+            rect = QRectF(self.start_point, self.inf_point).normalized()
+            self._line_bounds = rect.adjusted(-self.pen_width, -self.pen_width, self.pen_width, self.pen_width)
+        return self._line_bounds
+
+    def shape(self) -> QPainterPath:
+        """
+        Outline of the drawn path, so clicks next to a ray reach the items below it.
+        Stroked on first use and cached until the path or the laser changes.
+        """
+        if self._shape is None:
+            path = QPainterPath()
+            if self._batches:
+                for _, batch in self._batches:
+                    path.addPath(batch)
+            else:
+                path.moveTo(self.start_point)
+                path.lineTo(self.inf_point)
+            stroker = QPainterPathStroker()
+            stroker.setWidth(self.pen_width)
+            self._shape = stroker.createStroke(path)
+        return self._shape
+
+    def invalidate_geometry(self):
+        """
+        Drops the cached source point and bounds, called when the laser moved or rotated.
+        """
+        if self._cached_start_point is None and self._line_bounds is None and self._shape is None:
+            return
+        self.prepareGeometryChange()
+        self._cached_start_point = self._cached_inf_point = self._line_bounds = self._shape = None
 
     def paint(self, painter, option, widget=None):
-        gradient = QLinearGradient(self.start_point, self.inf_point)
-        gradient.setColorAt(0, QColor(255, 255, 0, 255))
-        gradient.setColorAt(0.85, QColor(255, 255, 0, 255))
-        gradient.setColorAt(1.0, QColor(255, 255, 0, 0))
-        pen = QPen(QBrush(gradient), self.pen_width)
-        if len(self.path_points) > 0:
-            current_pen_alpha = 55
-            painter.setPen(QPen(QColor(255, 155, 0, current_pen_alpha), self.pen_width))
-            print(self.path_points)
-            for i, point in enumerate(self.path_points):
-                pen_alpha = point.get("alpha_color", 255)
-                if pen_alpha != current_pen_alpha:
-                    current_pen_alpha = pen_alpha
-                    pen.setColor(QColor(255, 0, 0, current_pen_alpha))
-                    painter.setPen(pen)
-                painter.drawLine(self.path_points[i].get("start"), self.path_points[i].get("end"))
+        with Profiler.stage("paint"):
+            self.paint_path(painter)
+
+    def paint_path(self, painter: QPainter):
+        if self._batches:
+            if log.debug:
+                log.event("paint", segments=len(self._segments), batches=len(self._batches))
+            painter.setBrush(Qt.BrushStyle.NoBrush)
+            for pen, path in self._batches:
+                painter.setPen(pen)
+                painter.drawPath(path)
         else:
-            painter.setPen(pen)
+            gradient = QLinearGradient(self.start_point, self.inf_point)
+            gradient.setColorAt(0, QColor(255, 255, 0, 255))
+            gradient.setColorAt(0.85, QColor(255, 255, 0, 255))
+            gradient.setColorAt(1.0, QColor(255, 255, 0, 0))
+            painter.setPen(QPen(QBrush(gradient), self.pen_width))
             painter.drawLine(self.start_point, self.inf_point)
 
+    def set_path_segments(self, paths):
+        """
+        Replaces the drawn path with traced segments.
+        :param paths: `RayPath` of every traced ray
+        """
+        with Profiler.stage("convert"):
+            self.prepareGeometryChange()
+            self._segments = (np.concatenate([path.array() for path in paths]) if paths
+                              else np.empty((0, RayPath.FIELDS)))
+            self._wavelengths = np.repeat([path.wavelength for path in paths], [len(path) for path in paths])
+            self._batches = self.build_batches(self._segments, self._wavelengths)
+            self._bounds = QRectF()
+            for _, path in self._batches:
+                self._bounds = self._bounds.united(path.boundingRect())
+            self._bounds.adjust(-self.pen_width, -self.pen_width, self.pen_width, self.pen_width)
+            self._shape = None
+        self.rerender()
+
+    def build_batches(self, segments: np.ndarray,
+                      wavelengths: np.ndarray | None = None) -> list[tuple[QPen, QPainterPath]]:
+        """
+        Groups segments by alpha and color into one `QPainterPath` per bucket, so a repaint takes a few draw calls.
+        :param segments: Array (k, 5) with rows start_x, start_y, end_x, end_y, alpha
+        :param wavelengths: Array (k,) of segment wavelengths, None or 0 for red rays
+        :return: Pen and path of every bucket, dimmest first so brighter rays are drawn on top
+        """
+        step = RayGraphicItem.ALPHA_STEP
+        alphas = np.clip(np.rint(segments[:, 4] / step) * step, 0, 255).astype(int)
+        if wavelengths is None:
+            wavelengths = np.zeros(len(segments))
+        wavelengths = np.rint(wavelengths / RayGraphicItem.WAVELENGTH_STEP) * RayGraphicItem.WAVELENGTH_STEP
+        batches = []
+        for alpha, wavelength in np.unique(np.column_stack((alphas, wavelengths)), axis=0).tolist():
+            path = QPainterPath()
+            bucket = (alphas == alpha) & (wavelengths == wavelength)
+            for start_x, start_y, end_x, end_y in segments[bucket, :4].tolist():
+                path.moveTo(start_x, start_y)
+                path.lineTo(end_x, end_y)
+            batches.append((QPen(QColor(*RayGraphicItem.wavelength_color(wavelength), int(alpha)), self.pen_width),
+                            path))
+        return batches
+
+    @staticmethod
+    def wavelength_color(wavelength: float) -> tuple[int, int, int]:
+        """
+        Approximates the RGB color of visible light by piecewise linear ramps.
+        :param wavelength: Wavelength [nm], 0 for the red of rays without a wavelength
+        """
+        if wavelength <= 0:
+            return 255, 0, 0
+        if wavelength < 440:
+            rgb = ((440 - wavelength) / 60, 0, 1)
+        elif wavelength < 490:
+            rgb = (0, (wavelength - 440) / 50, 1)
+        elif wavelength < 510:
+            rgb = (0, 1, (510 - wavelength) / 20)
+        elif wavelength < 580:
+            rgb = ((wavelength - 510) / 70, 1, 0)
+        elif wavelength < 645:
+            rgb = (1, (645 - wavelength) / 65, 0)
+        else:
+            rgb = (1, 0, 0)
+        return tuple(int(round(255 * min(max(channel, 0), 1))) for channel in rgb)
+
     def rerender(self):
-        self.scene().update()
-        self.prepareGeometryChange()
+        """
+        Repaints the item, callers announce bounds changes with `prepareGeometryChange` beforehand,
+        so only the old and new extents of the ray are invalidated rather than the whole scene.
+        """
         self.update()
 
     @property
-    def path_points(self):
-        return self._path_points
-
-    @path_points.setter
-    def path_points(self, value):
-        self._path_points = value
-        self.rerender()
+    def segments(self) -> np.ndarray:
+        """Drawn segments, an array (k, 5) with rows start_x, start_y, end_x, end_y, alpha."""
+        return self._segments
 
     @property
     def start_point(self):
-        if not self.parent:
-            return round_point(self._start_point)
-        return round_point(self.parent.source_point)
+        if self._cached_start_point is None:
+            self._cached_start_point = round_point(self.parent.source_point if self.parent else self._start_point)
+        return self._cached_start_point
 
     @property
     def inf_point(self):
         if self._inf_point is not None:
             return self._inf_point
-        end_x = self.start_point.x() + RAY_MAX_LENGTH * cos(self.angle_rad)
-        end_y = self.start_point.y() + RAY_MAX_LENGTH * sin(self.angle_rad)
-        return QPointF(end_x, end_y)
+        if self._cached_inf_point is None:
+            end_x = self.start_point.x() + RAY_MAX_LENGTH * cos(self.angle_rad)
+            end_y = self.start_point.y() + RAY_MAX_LENGTH * sin(self.angle_rad)
+            self._cached_inf_point = QPointF(end_x, end_y)
+        return self._cached_inf_point
 
     @inf_point.setter
     def inf_point(self, value):
+        self.prepareGeometryChange()
         self._inf_point = value
+        self._line_bounds = self._shape = None
         self.rerender()
 
     @property
@@ -8,6 +8,7 @@ from graphic.config import SCENE_SIZE
 from render.Laser import Laser
 from render.Len import Len
 from render.Mirror import Mirror
+from render.SceneLoader import load_scene
 
 
 def main():
@@ -31,12 +32,15 @@ def main():
     # Len(0, 10, 200, view, -30, 30)
     # Laser(50, 50, 50, view)
 
-    for i in range(MIRROR_COUNT):
-        Mirror(0+i*30,0, 20,200, view)
-    for i in range(LEN_COUNT):
-        Len(0, 10+i*30, 200, view, -30, 30)
-    for i in range(LASER_COUNT):
-        Laser(150+i*30, 50, 50, view)
+    if len(sys.argv) > 1:  # python main.py scene.jsonl
+        load_scene(sys.argv[1], view)
+    else:
+        for i in range(MIRROR_COUNT):
+            Mirror(0+i*30,0, 20,200, view)
+        for i in range(LEN_COUNT):
+            Len(0, 10+i*30, 200, view, -30, 30)
+        for i in range(LASER_COUNT):
+            Laser(150+i*30, 50, 50, view)
 
     ###################################################################
 
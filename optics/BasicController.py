@@ -2,6 +2,8 @@ from abc import ABC, abstractmethod
 
 from sympy import Point2D, Segment2D, Ray2D
 
+from optics.util import Vec2
+
 
 class BasicController(ABC):
     """
@@ -15,6 +17,48 @@ class BasicController(ABC):
         Detects the collision of a ray with the object.
         :param ray: The ray to check for collisions with
         :type ray: RayController
-        :return: List of collision points
+        :return: Collision data with `point`, `normal`, `surface`, the hit `object`, `material` and `thickness`
+            or None. `is-from-inside` may be left out, `Solver` then derives it from the medium the ray travels in.
         """
         pass
+
+    @abstractmethod
+    def get_numeric_collision(self, origin: Vec2, direction: Vec2) -> dict | None:
+        """
+        Detects the nearest collision of a ray with the object using float arithmetic.
+        :param origin: The ray source point
+        :param direction: The unit direction vector of the ray
+        :return: Collision data with `point`, outward unit `normal`, `distance`, the hit `object`, `material`,
+            `is-from-inside` and `thickness` or None
+        """
+        pass
+
+    def is_point_inside(self, point) -> bool:
+        """
+        Checks if a point is inside the material of the object, see `Solver.medium_at`.
+        :param point: Point with float `x` and `y`
+        """
+        return False
+
+    @property
+    def float_edges(self) -> list[tuple[Vec2, Vec2, Vec2]]:
+        """
+        Flat surfaces of the object as (start, end, outward unit normal), used by the batch engine.
+        """
+        return []
+
+    @property
+    def float_curves(self) -> list[tuple]:
+        """
+        Elliptic surfaces of the object as (center, h_radius, v_radius, angle, clipping polygon, orientation),
+        used by the batch engine.
+        """
+        return []
+
+    @property
+    def bounds(self) -> tuple[float, float, float, float] | None:
+        """
+        Axis-aligned bounding box of the object as (min_x, min_y, max_x, max_y).
+        None means unknown bounds, such objects are tested against every ray.
+        """
+        return None
@@ -0,0 +1,386 @@
+from math import inf
+from time import perf_counter
+
+import numpy as np
+
+from conf import RAY_MAX_LENGTH, MAX_REFRACTIONS, IS_REFLECTION, IS_REFRACTION, TRACE_TIME_BUDGET
+from optics.NumericSolver import NumericSolver
+from optics.Profiler import Profiler
+from optics.RayPath import RayPath
+from optics.RayQueue import RayQueue
+from optics.Solver import Solver
+from optics.TraceLog import TraceLog
+
+log = TraceLog.channel("batch")
+
+
+class BatchSolver:
+    """
+    Vectorized counterpart of `NumericSolver`.
+    Traces many rays at once: every bounce intersects all active rays with all mirror edges
+    and lens curves in a single NumPy broadcast instead of looping over rays in Python.
+
+    Rays may carry a wavelength. The refractive indices of all surfaces are tabulated once per
+    distinct wavelength, so a white beam is traced as a single batch of rays times wavelengths.
+    """
+
+    # Wavelengths [nm] sampled by white lasers, see `spectrum`
+    VISIBLE_SPECTRUM = (380.0, 750.0)
+
+    @staticmethod
+    def build_scene() -> dict[str, np.ndarray]:
+        """
+        Collects the float geometry of all optical objects into flat arrays.
+        :return: Dict with mirror `edges`, lens `curves` with their clipping `quads`, per-surface `props`
+                 and `materials`
+        """
+        edges, edge_props, curves, curve_props, quads = [], [], [], [], []
+        edge_materials, curve_materials = [], []
+        for obj in Solver.optical_objects:
+            obj_edges, obj_curves = obj.float_edges, obj.float_curves
+            if not obj_edges and not obj_curves:
+                continue
+            material, thickness = obj.material, obj.thickness
+            # The absorption does not depend on the indices, the memoized terms of the entry from the air are reused
+            props = (material.refractive_index, material.absorption_coefficient, thickness,
+                     Solver.interface(material, 1, material.refractive_index, thickness).absorption)
+            for p1, p2, normal in obj_edges:
+                edges.append((p1.x, p1.y, p2.x, p2.y, normal.x, normal.y))
+                edge_props.append(props)
+                edge_materials.append(material)
+            for center, h_radius, v_radius, angle, polygon, orientation in obj_curves:
+                curves.append((center.x, center.y, h_radius, v_radius, angle, orientation))
+                curve_props.append(props)
+                curve_materials.append(material)
+                quads.append([(point.x, point.y) for point in polygon])
+        return {
+            "edges": np.array(edges, dtype=float).reshape(-1, 6),
+            "curves": np.array(curves, dtype=float).reshape(-1, 6),
+            "quads": np.array(quads, dtype=float).reshape(-1, 4, 2),
+            # Refractive index, absorption coefficient, thickness and absorption of every surface, edges first
+            "props": np.array(edge_props + curve_props, dtype=float).reshape(-1, 4),
+            "materials": edge_materials + curve_materials,
+        }
+
+    @staticmethod
+    def dispersion_table(scene: dict, wavelengths: np.ndarray) -> np.ndarray:
+        """
+        Evaluates the refractive index of every surface of the scene at every wavelength.
+        :param wavelengths: Array (W,) of wavelengths [nm]
+        :return: Array (S, W) of refractive indices, surfaces in the order of `scene["props"]`
+        """
+        indices = {}  # Surfaces of one object share its material
+        for material in scene["materials"]:
+            if id(material) not in indices:
+                indices[id(material)] = material.refractive_index_at(wavelengths)
+        return np.array([indices[id(material)] for material in scene["materials"]],
+                        dtype=float).reshape(-1, len(wavelengths))
+
+    @staticmethod
+    def emit_rays(origin: tuple[float, float], angle_deg: float, ray_count: int, width: float = 0,
+                  spread: float = 0) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Calculates source points and unit directions of a beam of rays.
+        Rays are spread evenly across `width` (a wide beam) and/or across `spread` degrees (a fan).
+
+        :param origin: Center of the beam source
+        :param angle_deg: Direction of the central ray in degrees
+        :param ray_count: Number of rays
+        :param width: Distance between the outermost source points
+        :param spread: Angle in degrees between the outermost rays
+        :return: Arrays (N, 2) of origins and directions
+        """
+        angle = np.radians(angle_deg)
+        offsets = np.linspace(-width / 2, width / 2, ray_count)
+        angles = angle + np.radians(np.linspace(-spread / 2, spread / 2, ray_count))
+        origins = np.column_stack((origin[0] - offsets * np.sin(angle), origin[1] + offsets * np.cos(angle)))
+        return origins, np.column_stack((np.cos(angles), np.sin(angles)))
+
+    @staticmethod
+    def spectrum(wavelength: float = 0, samples: int = 0) -> np.ndarray | None:
+        """
+        Picks the wavelengths a laser emits.
+        :param wavelength: Wavelength [nm] of a monochromatic laser, 0 for none
+        :param samples: Number of wavelengths sampled evenly across `VISIBLE_SPECTRUM` for white light,
+                        takes precedence over `wavelength` when above 1
+        :return: Array (W,) of wavelengths, None for a laser without a wavelength
+        """
+        if samples > 1:
+            return np.linspace(*BatchSolver.VISIBLE_SPECTRUM, samples)
+        if wavelength > 0:
+            return np.array([float(wavelength)])
+        return None
+
+    @staticmethod
+    def emit_spectrum(origins: np.ndarray, directions: np.ndarray,
+                      wavelengths: np.ndarray | None) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+        """
+        Repeats every ray once per wavelength, so all wavelengths are traced together as one batch.
+        :param wavelengths: Array (W,) of wavelengths, see `spectrum`
+        :return: Arrays (N * W, 2) of origins and directions and (N * W,) of wavelengths,
+                 the wavelengths of a ray are consecutive
+        """
+        if wavelengths is None:
+            return origins, directions, None
+        count = len(wavelengths)
+        return (np.repeat(origins, count, axis=0), np.repeat(directions, count, axis=0),
+                np.tile(wavelengths, len(origins)))
+
+    @staticmethod
+    def get_paths(origins: np.ndarray, directions: np.ndarray,
+                  wavelengths: np.ndarray | None = None) -> list[RayPath]:
+        """
+        Traces a batch of rays and all of their reflected and refracted children.
+        Rays are expanded bounce by bounce. Of every bounce, the brightest rays of each tree are
+        traced first, which approximates the brightest first order of `RayQueue` per bounce.
+
+        :param origins: Array (N, 2) of ray source points
+        :param directions: Array (N, 2) of unit direction vectors
+        :param wavelengths: Array (N,) of ray wavelengths [nm], None or 0 for the reference refractive indices
+        :return: Segments of every input ray
+        """
+        scene = BatchSolver.build_scene()
+        origins = np.asarray(origins, dtype=float).reshape(-1, 2)
+        directions = np.asarray(directions, dtype=float).reshape(-1, 2)
+        count = len(origins)
+        if wavelengths is None:
+            wavelengths = np.zeros(count)
+        else:
+            wavelengths = np.asarray(wavelengths, dtype=float).reshape(count)
+        # Every tree keeps the wavelength of its ray, the index of a hit is looked up by (surface, wavelength)
+        distinct, wavelength_ids = np.unique(wavelengths, return_inverse=True)
+        indices = BatchSolver.dispersion_table(scene, distinct)
+        Profiler.count("rays", count)
+        ids = np.arange(count)
+        alphas = np.full(count, 255.0)
+        budget = np.full(count, MAX_REFRACTIONS + 1)  # Segments per tree, like the limit of `RayQueue`
+        deadline = perf_counter() + TRACE_TIME_BUDGET / 1000 if TRACE_TIME_BUDGET > 0 else inf
+        rng = np.random.default_rng(0)  # Seeded like `RayQueue`, tracing the same scene twice draws the same paths
+        segments, segment_ids = [], []
+
+        while len(ids):
+            # Drop dim rays and play Russian roulette with the rays below `RayQueue.ROULETTE_ALPHA`
+            keep = alphas >= RayQueue.MIN_ALPHA
+            roulette = alphas < RayQueue.ROULETTE_ALPHA
+            if roulette.any():
+                keep &= ~roulette | (rng.random(len(alphas)) * RayQueue.ROULETTE_ALPHA < alphas)
+                alphas = np.where(roulette, RayQueue.ROULETTE_ALPHA, alphas)
+            # Keep the brightest rays of each tree, as many as its budget allows
+            order = np.flatnonzero(keep)[np.argsort(-alphas[keep], kind="stable")]
+            origins, directions, alphas, ids = origins[order], directions[order], alphas[order], ids[order]
+            keep = BatchSolver.rank_in_groups(ids) < budget[ids]
+            origins, directions, alphas, ids = origins[keep], directions[keep], alphas[keep], ids[keep]
+            budget -= np.bincount(ids, minlength=count)
+            if not len(ids) or perf_counter() > deadline:
+                break
+
+            with Profiler.stage("collision"):
+                distances, surfaces, normals = BatchSolver.find_first_collisions(origins, directions, scene)
+            Profiler.count("bounces", len(ids))
+            Profiler.count("intersection_tests", len(ids) * (len(scene["edges"]) + len(scene["curves"])))
+            hit = np.isfinite(distances)
+            ends = origins + np.where(hit, distances, RAY_MAX_LENGTH)[:, None] * directions
+            segments.append(np.column_stack((origins, ends, alphas)))
+            segment_ids.append(ids)
+            if log.debug:
+                log.event("bounce", rays=len(ids), hits=int(hit.sum()), bounce=len(segments))
+
+            with Profiler.stage("reflect_refract"):
+                origins, directions, alphas, ids, normals = (ends[hit], directions[hit], alphas[hit], ids[hit],
+                                                             normals[hit])
+                refractive_index = indices[surfaces[hit], wavelength_ids[ids]]
+                absorption = scene["props"][surfaces[hit], 3]
+                cos_incidence = np.einsum("ij,ij->i", directions, normals)
+                from_inside = cos_incidence > 0
+                n1 = np.where(from_inside, refractive_index, 1.0)
+                n2 = np.where(from_inside, 1.0, refractive_index)
+                transmission, surface_transmission = BatchSolver.interface_factors(n1, n2, cos_incidence, absorption)
+
+                # Children are keyed by parent position, so rays of equal alpha keep the order they were queued in
+                children, parents = [], np.arange(len(ids))
+                if IS_REFLECTION:
+                    reflected_alphas = alphas - alphas * surface_transmission
+                    children.append((origins, BatchSolver.reflect(directions, normals), reflected_alphas, ids,
+                                     parents * 2))
+                if IS_REFRACTION:
+                    refracted, valid = BatchSolver.refract(directions, normals, n1, n2)
+                    refracted_alphas = alphas * transmission
+                    children.append((origins[valid], refracted[valid], refracted_alphas[valid], ids[valid],
+                                     parents[valid] * 2 + 1))
+                if children:
+                    origins, directions, alphas, ids, keys = (np.concatenate(parts) for parts in zip(*children))
+                    order = np.argsort(keys, kind="stable")
+                    origins, directions, alphas, ids = origins[order], directions[order], alphas[order], ids[order]
+            if not children:
+                break
+
+        if not segments:
+            return [RayPath(wavelength=wavelength) for wavelength in wavelengths.tolist()]
+        segments, segment_ids = np.concatenate(segments), np.concatenate(segment_ids)
+        order = np.argsort(segment_ids, kind="stable")
+        splits = np.split(segments[order], np.cumsum(np.bincount(segment_ids, minlength=count))[:-1])
+        return [RayPath.from_array(rows, wavelength) for rows, wavelength in zip(splits, wavelengths.tolist())]
+
+    @staticmethod
+    def rank_in_groups(ids: np.ndarray) -> np.ndarray:
+        """
+        Returns the position of every element among the elements with the same id, in array order.
+        """
+        order = np.argsort(ids, kind="stable")
+        sorted_ids = ids[order]
+        starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+        group_start = np.repeat(starts, np.diff(np.r_[starts, len(ids)]))
+        rank = np.empty(len(ids), dtype=int)
+        rank[order] = np.arange(len(ids)) - group_start
+        return rank
+
+    @staticmethod
+    def find_first_collisions(origins: np.ndarray, directions: np.ndarray,
+                              scene: dict[str, np.ndarray]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Detects the nearest collision of every ray with all surfaces of the scene.
+        :return: Distances (inf on miss), surface indices into `scene["props"]` and outward unit normals
+        """
+        edges, curves = scene["edges"], scene["curves"]
+        distances = np.concatenate((
+            BatchSolver.intersect_segments(origins, directions, edges[:, 0:2], edges[:, 2:4]),
+            BatchSolver.intersect_curves(origins, directions, curves, scene["quads"]),
+        ), axis=1)
+        normals = np.zeros_like(origins)
+        if not distances.shape[1]:
+            return np.full(len(origins), np.inf), np.zeros(len(origins), dtype=int), normals
+        surfaces = np.argmin(distances, axis=1)
+        distances = distances[np.arange(len(origins)), surfaces]
+
+        on_edge = np.isfinite(distances) & (surfaces < len(edges))
+        normals[on_edge] = edges[surfaces[on_edge], 4:6]
+        on_curve = np.isfinite(distances) & (surfaces >= len(edges))
+        if on_curve.any():
+            curve = curves[surfaces[on_curve] - len(edges)]
+            points = origins[on_curve] + distances[on_curve, None] * directions[on_curve]
+            normals[on_curve] = BatchSolver.ellipse_normals(points, curve) * curve[:, 5:6]
+        return distances, surfaces, normals
+
+    @staticmethod
+    def intersect_segments(origins: np.ndarray, directions: np.ndarray, p1: np.ndarray, p2: np.ndarray) -> np.ndarray:
+        """
+        Calculates distances from every ray (N) to every segment (S).
+        :return: Array (N, S) of distances, inf where the ray misses the segment
+        """
+        ex, ey = (p2 - p1).T
+        dx, dy = directions[:, 0:1], directions[:, 1:2]
+        wx, wy = p1[:, 0] - origins[:, 0:1], p1[:, 1] - origins[:, 1:2]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            denominator = dx * ey - dy * ex
+            t = (wx * ey - wy * ex) / denominator
+            u = (wx * dy - wy * dx) / denominator
+        valid = (denominator != 0) & (t > NumericSolver.EPSILON) & (u >= 0) & (u <= 1)
+        return np.where(valid, t, np.inf)
+
+    @staticmethod
+    def intersect_curves(origins: np.ndarray, directions: np.ndarray, curves: np.ndarray,
+                         quads: np.ndarray) -> np.ndarray:
+        """
+        Calculates distances from every ray (N) to every lens curve (C) clipped by its polygon.
+        :return: Array (N, C) of distances to the nearest valid root, inf where the ray misses the curve
+        """
+        cx, cy, h_radius, v_radius, angle = curves[:, :5].T
+        c, s = np.cos(angle), np.sin(angle)
+        rx, ry = origins[:, 0:1] - cx, origins[:, 1:2] - cy
+        px, py = rx * c + ry * s, -rx * s + ry * c
+        vx, vy = directions[:, 0:1] * c + directions[:, 1:2] * s, -directions[:, 0:1] * s + directions[:, 1:2] * c
+        a2, b2 = h_radius ** 2, v_radius ** 2
+        qa = vx * vx / a2 + vy * vy / b2
+        qb = 2 * (px * vx / a2 + py * vy / b2)
+        qc = px * px / a2 + py * py / b2 - 1
+        discriminant = qb * qb - 4 * qa * qc
+        root = np.sqrt(np.maximum(discriminant, 0))
+        result = np.full(qa.shape, np.inf)
+        for t in ((-qb + root) / (2 * qa), (-qb - root) / (2 * qa)):  # Far root first, the near one overrides it
+            points = origins[:, None, :] + t[..., None] * directions[:, None, :]
+            valid = (discriminant >= 0) & (t > NumericSolver.EPSILON) & BatchSolver.points_in_quads(points, quads)
+            result = np.where(valid, t, result)
+        return result
+
+    @staticmethod
+    def points_in_quads(points: np.ndarray, quads: np.ndarray) -> np.ndarray:
+        """
+        Checks whether points (N, C, 2) lie inside the matching convex quadrilaterals (C, 4, 2) or on their
+        boundary, within `NumericSolver.EPSILON` like `is_point_inside_convex_polygon`.
+        """
+        edges = np.roll(quads, -1, axis=1) - quads
+        relative = points[:, :, None, :] - quads[None, :, :, :]
+        cross = edges[None, :, :, 0] * relative[..., 1] - edges[None, :, :, 1] * relative[..., 0]
+        tolerance = NumericSolver.EPSILON * np.linalg.norm(edges, axis=2)[None, :, :]
+        return np.all(cross >= -tolerance, axis=2) | np.all(cross <= tolerance, axis=2)
+
+    @staticmethod
+    def ellipse_normals(points: np.ndarray, curves: np.ndarray) -> np.ndarray:
+        """
+        Calculates outward unit normals of the ellipses (one per point) from the gradient of their equation.
+        """
+        cx, cy, h_radius, v_radius, angle = curves[:, :5].T
+        c, s = np.cos(angle), np.sin(angle)
+        rx, ry = points[:, 0] - cx, points[:, 1] - cy
+        gx, gy = (rx * c + ry * s) / h_radius ** 2, (-rx * s + ry * c) / v_radius ** 2
+        normals = np.column_stack((gx * c - gy * s, gx * s + gy * c))
+        return normals / np.linalg.norm(normals, axis=1, keepdims=True)
+
+    @staticmethod
+    def reflect(directions: np.ndarray, normals: np.ndarray) -> np.ndarray:
+        dot = np.einsum("ij,ij->i", directions, normals)
+        return directions - 2 * dot[:, None] * normals
+
+    @staticmethod
+    def refract(directions: np.ndarray, normals: np.ndarray, n1: np.ndarray,
+                n2: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Refracts directions with the vector form of Snell's law.
+        :return: Refracted directions and a mask of rays without total internal reflection
+        """
+        cos_i = -np.einsum("ij,ij->i", directions, normals)
+        normals = np.where((cos_i < 0)[:, None], -normals, normals)  # Orient normals against the rays
+        cos_i = np.abs(cos_i)
+        eta = n1 / n2
+        k = 1 - eta ** 2 * (1 - cos_i ** 2)
+        valid = k >= 0
+        factor = eta * cos_i - np.sqrt(np.maximum(k, 0))
+        return eta[:, None] * directions + factor[:, None] * normals, valid
+
+    @staticmethod
+    def interface_factors(n1: np.ndarray, n2: np.ndarray, cos_incidence: np.ndarray,
+                          absorption: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized `Solver.interface_factors` for all hits of a bounce.
+        :param absorption: Memoized absorption of every hit layer, see `Solver.interface`
+        :return: Arrays of transmissions and surface transmissions, both zero on total internal reflection
+        """
+        r_input = BatchSolver.fresnel_reflectance(n1, n2, cos_incidence)
+        cos_refraction = np.sqrt(np.maximum(0.0, 1 - (n1 / n2) ** 2 * (1 - cos_incidence ** 2)))
+        r_output = BatchSolver.fresnel_reflectance(n2, n1, cos_refraction)
+        transmission = (1 - r_input) * (1 - r_output) * absorption / (1 - r_input * r_output * absorption ** 2)
+        return transmission, 1 - r_input
+
+    @staticmethod
+    def fresnel_reflectance(n1, n2, cos_incidence) -> np.ndarray:
+        """
+        Vectorized `Solver.fresnel_reflectance`, accepts arrays or scalars for every parameter.
+        """
+        cos_i = np.abs(cos_incidence)
+        sin_t2 = (n1 / n2) ** 2 * (1 - cos_i ** 2)
+        cos_t = np.sqrt(np.maximum(0.0, 1 - sin_t2))
+        r_s = (n1 * cos_i - n2 * cos_t) / (n1 * cos_i + n2 * cos_t)
+        r_p = (n2 * cos_i - n1 * cos_t) / (n2 * cos_i + n1 * cos_t)
+        return np.where(sin_t2 >= 1, 1.0, (r_s * r_s + r_p * r_p) / 2)
+
+    @staticmethod
+    def calculate_alpha(alpha_initial, n1, n2, mu, thickness, n_output=None):
+        """
+        Vectorized `Solver.calculate_alpha` at normal incidence, accepts arrays or scalars for every parameter.
+        """
+        if n_output is None:
+            n_output = n1
+        r_input = BatchSolver.fresnel_reflectance(n1, n2, 1.0)
+        r_output = BatchSolver.fresnel_reflectance(n2, n_output, 1.0)
+        absorption = np.exp(-np.asarray(mu) * thickness)
+        return alpha_initial * (1 - r_input) * (1 - r_output) * absorption / (1 - r_input * r_output * absorption ** 2)
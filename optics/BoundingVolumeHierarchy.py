@@ -0,0 +1,158 @@
+from math import inf
+
+from optics.util import Vec2
+
+
+class BoundingVolumeHierarchy:
+    """
+    Binary tree of axis-aligned bounding boxes over optical objects.
+    Lets ray queries skip every object whose box the ray misses.
+    Objects provide their box through the `bounds` property as (min_x, min_y, max_x, max_y);
+    objects without bounds are returned by every query.
+    """
+
+    class Node:
+        __slots__ = ("bounds", "left", "right", "obj", "parent")
+
+        def __init__(self, bounds, left=None, right=None, obj=None):
+            self.bounds = bounds
+            self.left = left
+            self.right = right
+            self.obj = obj
+            self.parent = None
+
+    def __init__(self):
+        self.root = None
+        self._leaves = {}  # id(obj) -> leaf node
+        self._unbounded = []
+        self._count = 0
+        self._stale = True
+
+    def is_stale(self, objects: list) -> bool:
+        """
+        Checks whether the tree has to be rebuilt for the given objects.
+        Objects are added and removed through `Solver.add_object` and `Solver.remove_object`, which mark
+        the tree stale, a changed count catches lists modified directly.
+        """
+        return self._stale or self._count != len(objects)
+
+    def invalidate(self):
+        """
+        Marks the tree for a rebuild on the next query, called when objects are added or removed.
+        """
+        self._stale = True
+
+    def build(self, objects: list):
+        """
+        Builds the tree from scratch, splitting objects at the median of the longest axis.
+        """
+        self._leaves = {}
+        self._unbounded = [obj for obj in objects if obj.bounds is None]
+        leaves = []
+        for obj in objects:
+            if obj.bounds is not None:
+                leaf = BoundingVolumeHierarchy.Node(obj.bounds, obj=obj)
+                self._leaves[id(obj)] = leaf
+                leaves.append(leaf)
+        self.root = self._build_node(leaves) if leaves else None
+        self._count = len(objects)
+        self._stale = False
+
+    def _build_node(self, leaves: list) -> 'BoundingVolumeHierarchy.Node':
+        if len(leaves) == 1:
+            return leaves[0]
+        bounds = BoundingVolumeHierarchy.union(leaf.bounds for leaf in leaves)
+        axis = 0 if bounds[2] - bounds[0] >= bounds[3] - bounds[1] else 1
+        leaves.sort(key=lambda leaf: leaf.bounds[axis] + leaf.bounds[axis + 2])
+        middle = len(leaves) // 2
+        node = BoundingVolumeHierarchy.Node(bounds, self._build_node(leaves[:middle]),
+                                            self._build_node(leaves[middle:]))
+        node.left.parent = node
+        node.right.parent = node
+        return node
+
+    def refit(self, obj):
+        """
+        Updates the box of a moved or resized object and enlarges/shrinks its ancestors.
+        Unknown objects mark the tree for a rebuild on the next query.
+        """
+        leaf = self._leaves.get(id(obj))
+        if leaf is None or obj.bounds is None:
+            self._stale = True
+            return
+        leaf.bounds = obj.bounds
+        node = leaf.parent
+        while node is not None:
+            node.bounds = BoundingVolumeHierarchy.union((node.left.bounds, node.right.bounds))
+            node = node.parent
+
+    def query(self, origin: Vec2, direction: Vec2, max_distance: float = inf) -> list[tuple[float, object]]:
+        """
+        Finds objects whose boxes are crossed by the ray.
+        :param origin: The ray source point
+        :param direction: The direction vector of the ray
+        :param max_distance: Boxes entered further than this are skipped
+        :return: List of (entry distance, object) sorted by the entry distance
+        """
+        hits = [(0.0, obj) for obj in self._unbounded]
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            entry = BoundingVolumeHierarchy.ray_box_entry(origin, direction, node.bounds, max_distance)
+            if entry is None:
+                continue
+            if node.obj is not None:
+                hits.append((entry, node.obj))
+            else:
+                stack.append(node.left)
+                stack.append(node.right)
+        hits.sort(key=lambda hit: hit[0])
+        return hits
+
+    def objects_at(self, point: Vec2) -> list:
+        """
+        Finds objects whose boxes contain the point, descending only into boxes containing it.
+        """
+        hits = list(self._unbounded)
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            bounds = node.bounds
+            if not (bounds[0] <= point.x <= bounds[2] and bounds[1] <= point.y <= bounds[3]):
+                continue
+            if node.obj is not None:
+                hits.append(node.obj)
+            else:
+                stack.append(node.left)
+                stack.append(node.right)
+        return hits
+
+    @staticmethod
+    def ray_box_entry(origin: Vec2, direction: Vec2, bounds: tuple, max_distance: float = inf) -> float | None:
+        """
+        Slab test of a ray against an axis-aligned box.
+        :return: Distance at which the ray enters the box (0 when it starts inside) or None on miss
+        """
+        t_min, t_max = 0.0, max_distance
+        for o, d, low, high in ((origin.x, direction.x, bounds[0], bounds[2]),
+                                (origin.y, direction.y, bounds[1], bounds[3])):
+            if d == 0:
+                if o < low or o > high:
+                    return None
+                continue
+            t1, t2 = (low - o) / d, (high - o) / d
+            if t1 > t2:
+                t1, t2 = t2, t1
+            t_min, t_max = max(t_min, t1), min(t_max, t2)
+            if t_min > t_max:
+                return None
+        return t_min
+
+    @staticmethod
+    def union(boxes) -> tuple[float, float, float, float]:
+        min_x = min_y = inf
+        max_x = max_y = -inf
+        for box in boxes:
+            min_x, min_y = min(min_x, box[0]), min(min_y, box[1])
+            max_x, max_y = max(max_x, box[2]), max(max_y, box[3])
+        return min_x, min_y, max_x, max_y
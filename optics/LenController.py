@@ -1,13 +1,18 @@
-from sympy import Point2D, cos, sin, pi, Ellipse, tan, Ray2D, Segment2D, Circle, Add, Eq
-from sympy.abc import x, y
+from math import radians, sqrt, cos, sin, hypot
 
-from conf import LEN_NORMAL_POINTS_DISTANCE
+from sympy import Point2D, pi, Ellipse, tan, Ray2D, Segment2D, Line2D, Circle, Add, Eq
+
+from conf import LEN_NORMAL_POINTS_DISTANCE, RAY_MAX_LENGTH
 from optics.BasicController import BasicController
 from optics.Material import Material
+from optics.NumericSolver import NumericSolver
 from optics.RayController import RayController
 from optics.Solver import Solver
+from optics.TraceLog import TraceLog
 from optics.util import round_point, round_line, round_ray, round_segment, deg2rad, string_points, \
-    is_point_inside_polygon
+    is_point_inside_polygon, is_point_inside_convex_polygon, round_and_float, Vec2, vec2point
+
+log = TraceLog.channel("lens")
 
 
 class LenController(BasicController):
@@ -18,6 +23,43 @@ class LenController(BasicController):
     DEFAULT_RADIUS = 20
     DEFAULT_HEIGHT = 100
 
+    VERTICES = ("top-left", "top-right", "bottom-right", "bottom-left")
+    CURVE_VERTICES = ("left-top", "left-bottom", "right-top", "right-bottom")
+
+    class Batch:
+        """
+        Transaction over the properties of a lens, see `LenController.batch`.
+        """
+        __slots__ = ("controller", "saved")
+
+        def __init__(self, controller: 'LenController'):
+            self.controller = controller
+            self.saved = None
+
+        def __enter__(self) -> 'LenController':
+            controller = self.controller
+            controller._batch_depth += 1
+            if controller._batch_depth == 1:
+                self.saved = controller.props
+            return controller
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            controller = self.controller
+            controller._batch_depth -= 1
+            if self.saved is None:  # Nested batch, the outermost one applies the changes
+                return False
+            try:
+                if exc_type is None:
+                    controller.validate()
+            except ValueError:
+                controller.props = self.saved
+                raise
+            if exc_type is not None:
+                controller.props = self.saved
+            elif controller.props != self.saved:
+                controller.update_props()
+            return False
+
     def __init__(self, pos_x, pos_y, d, height=DEFAULT_HEIGHT, left_radius=DEFAULT_RADIUS, right_radius=DEFAULT_RADIUS):
         """
         Initializes an instance of the `Len` class.
@@ -37,15 +79,22 @@ class LenController(BasicController):
         self._d = d  # The thickness of the len
         self.material = Material.glass()
 
-        self._vertices = {}
+        self._batch_depth = 0
+        # Float geometry used by collision queries, rebuilt by `update_props`
+        self._float_vertices: tuple[Vec2, ...] = ()
+        self._float_curve_vertices: tuple[Vec2, ...] = ()
+        self._float_curves = []
+        self._bounds = None
+        # SymPy geometry, None until it is needed after the last change
+        self._vertices = None
         self._sides = None
-        self._curve_vertices = {}
+        self._curve_vertices = None
         self._right_curve = None
         self._left_curve = None
 
         self.validate()
         self.update_props()
-        Solver.optical_objects.append(self)
+        Solver.add_object(self)
 
     def validate(self):
         """
@@ -60,69 +109,62 @@ class LenController(BasicController):
             raise ValueError("The height of the lens must be a positive value.")
 
     def get_collision(self, ray: Ray2D) -> dict[str, Point2D | Segment2D | bool] | None:
-        intersections = []
-        has_collision = False
-        for key, side in self.sides.items():
-            if Solver.first_intersection(ray, side):
-                has_collision = True
-        if not has_collision:
+        """
+        Detects the collision of a ray with the lens curves.
+        The curves are intersected analytically (quadratic roots of the ellipse equation)
+        and the normal comes from the gradient of the ellipse at the hit point.
+        """
+        origin = Vec2(float(ray.source.x), float(ray.source.y))
+        dx, dy = float(ray.direction.x), float(ray.direction.y)
+        length = sqrt(dx * dx + dy * dy)
+        direction = Vec2(dx / length, dy / length)
+        if not (collision := self.get_numeric_collision(origin, direction)):
+            return None
+        point = vec2point(collision["point"])
+        if point == round_point(ray.source):
             return None
+        nx, ny = collision["normal"]
+        if direction.x * nx + direction.y * ny < 0:  # Point the normal into the medium the ray enters
+            nx, ny = -nx, -ny
+        x, y = collision["point"]
+        tangent = Vec2(-ny * LEN_NORMAL_POINTS_DISTANCE, nx * LEN_NORMAL_POINTS_DISTANCE)
+        return {
+            "surface": Segment2D(vec2point(Vec2(x - tangent.x, y - tangent.y)),
+                                 vec2point(Vec2(x + tangent.x, y + tangent.y))),
+            "point": point,
+            # Long normal vector keeps the direction precise after rounding
+            "normal": Line2D(point, vec2point(Vec2(x + nx * RAY_MAX_LENGTH, y + ny * RAY_MAX_LENGTH))),
+            "object": self,
+            "material": self.material,
+            "is-from-inside": collision["is-from-inside"],
+            "thickness": self.thickness
+        }
 
-        def check_curve(ray_obj: Ray2D, curve_eq: Eq, h_radius: float, side_type: str):
-            if not (curve_intersections := Solver.all_intersections(ray_obj, curve_eq)):
-                return None
-            curve_intersections = Solver.sort_by_distance(ray_obj.source, curve_intersections)
-            print("Curve intersections:", string_points(curve_intersections))
-            polygon = []
-            if h_radius >= 0:
-                polygon = [
-                    self.vertices[f"top-{side_type}"],
-                    self.vertices[f"bottom-{side_type}"],
-                    self.curve_vertices[f"{side_type}-bottom"],
-                    self.curve_vertices[f"{side_type}-top"]
-                ]
-            elif h_radius < 0:
-                polygon = [
-                    self.vertices[f"top-left"],
-                    self.vertices[f"bottom-left"],
-                    self.vertices[f"bottom-right"],
-                    self.vertices[f"top-right"],
-                ]
-            for point in curve_intersections:
-                if is_point_inside_polygon(point, polygon):
-                    print(f"is_point_inside {side_type} : {string_points(point)}")
-                    circle_x, circle_y = point
-                    circle_eq = Eq((x - circle_x) ** 2 + (y - circle_y) ** 2, LEN_NORMAL_POINTS_DISTANCE ** 2)
-                    return {
-                        "point": point,
-                        "side": Segment2D(
-                            *Solver.solve_safe(curve_eq, circle_eq)
-                        )
-                    }
+    def get_numeric_collision(self, origin: Vec2, direction: Vec2) -> dict | None:
+        nearest_distance, nearest_normal = None, None
+        for center, h_radius, v_radius, angle, polygon, orientation in self._float_curves:
+            for distance in NumericSolver.intersect_ellipse(origin, direction, center, h_radius, v_radius, angle):
+                if nearest_distance is not None and distance >= nearest_distance:
+                    break
+                point = Vec2(origin.x + distance * direction.x, origin.y + distance * direction.y)
+                # The boundary counts, like in `BatchSolver.points_in_quads`, so hits at the apex are kept
+                if is_point_inside_convex_polygon(point, polygon, NumericSolver.EPSILON):
+                    normal = NumericSolver.ellipse_normal(point, center, h_radius, v_radius, angle)
+                    nearest_distance, nearest_normal = distance, Vec2(normal.x * orientation, normal.y * orientation)
+                    break
+        if nearest_distance is None:
             return None
+        return {
+            "point": Vec2(origin.x + nearest_distance * direction.x, origin.y + nearest_distance * direction.y),
+            "normal": nearest_normal,
+            "distance": nearest_distance,
+            "object": self,
+            "material": self.material,
+            "is-from-inside": direction.x * nearest_normal.x + direction.y * nearest_normal.y > 0,
+            "thickness": self.thickness
+        }
 
-        for curve, radius, side in [(self.left_curve, self.left_radius, "left"), (self.right_curve, self.right_radius, "right")]:
-            intersection = check_curve(ray, curve, radius, side)
-            if intersection:
-                intersections.append(intersection)
-        intersections = list(filter(lambda cp: cp["point"] != round_point(ray.source), intersections))
-        if intersections:
-            print("Intersections found:", intersections)
-            closest_intersection = min(intersections, key=lambda cp: cp["point"].distance(ray.source))
-            print("got intersection:", string_points(closest_intersection))
-            print("With ray:", ray)
-            return {
-                "surface": closest_intersection["side"],
-                "point": closest_intersection["point"],
-                "normal": round_line(closest_intersection["side"].perpendicular_line(closest_intersection["point"])),
-                "material": self.material,
-                "is-from-inside": self.is_point_inside(ray.source),
-                "thickness": self.d/100  # Assuming thickness [m] is the width of the lens
-            }
-        return None
-
-
-    def is_point_inside(self, point: Point2D) -> bool:
+    def is_point_inside(self, point: Point2D | Vec2) -> bool:
         """
         Checks if a point is inside the lens's area.
 
@@ -131,53 +173,79 @@ class LenController(BasicController):
            It does not give reliable results for all cases.
 
         :param point: The point to check
-        :type point: Point2D
+        :type point: Point2D or Vec2
         :return: True if the point is inside, False otherwise
         """
-        polygon = [
-            self.vertices["top-left"],
-            self.vertices["top-right"],
-            self.vertices["bottom-right"],
-            self.vertices["bottom-left"]
-        ]
-        return is_point_inside_polygon(point, polygon)
+        return is_point_inside_polygon((float(point.x), float(point.y)), self._float_vertices)
 
     def update_props(self):
         """
-        Calculates and updates the len.
+        Recalculates the float geometry of the len after a change.
+        The SymPy vertices, sides and curve equations are only marked stale and rebuilt when they are used.
         """
-        self.calc_curve_vertices()
-        self.calc_vertices()
-        self.calc_sides()
-        self.calc_left_curve()
-        self.calc_right_curve()
+        old_bounds = self.bounds
+        self.calc_float_vertices()
+        self.calc_float_curves()
+        self._vertices = self._sides = self._curve_vertices = self._left_curve = self._right_curve = None
+        Solver.object_changed(self, old_bounds)
         # todo check if the equation is correct, the rotation is correct
 
+    def batch(self) -> 'LenController.Batch':
+        """
+        Groups changes of the properties, e.g. `with lens.batch(): lens.pos = ...; lens.rotation = ...`.
+        The lens is validated and its geometry rebuilt once, when the outermost batch ends.
+        Invalid properties or an exception inside the batch roll all of its changes back.
+        Every property setter runs as a batch of its own.
+        """
+        return LenController.Batch(self)
+
+    @property
+    def props(self) -> tuple:
+        """
+        The properties defining the geometry: position, height, rotation, radii and thickness.
+        """
+        return self._pos, self._height, self._rotation, self._left_radius, self._right_radius, self._d
+
+    @props.setter
+    def props(self, props: tuple):
+        self._pos, self._height, self._rotation, self._left_radius, self._right_radius, self._d = props
+
+    def calc_float_vertices(self):
+        """
+        Calculates the rounded corners and curve vertices with float arithmetic.
+        """
+        angle = radians(self.rotation)
+        c, s = cos(angle), sin(angle)
+        x, y = float(self.pos.x), float(self.pos.y)
+        h2 = self.height / 2
+        rest_d2 = (self.d - abs(self.left_radius) - abs(self.right_radius)) / 2
+        left, right = abs(self.left_radius) + rest_d2, abs(self.right_radius) + rest_d2
+        left_shift = left if self.left_radius < 0 else rest_d2
+        right_shift = right if self.right_radius < 0 else rest_d2
+
+        def point(u: float, v: float) -> Vec2:
+            return Vec2(round_and_float(x + u * c - v * s), round_and_float(y + u * s + v * c))
+
+        self._float_vertices = (point(-left, h2), point(right, h2), point(right, -h2), point(-left, -h2))
+        self._float_curve_vertices = (point(-left_shift, h2), point(-left_shift, -h2),
+                                      point(right_shift, h2), point(right_shift, -h2))
+
     @property
     def vertices(self) -> dict:
+        if self._vertices is None:
+            self.calc_vertices()
         return self._vertices
 
     def calc_vertices(self):
-        height2cos = (self.height / 2) * cos(deg2rad(self.rotation))
-        height2sin = (self.height / 2) * sin(deg2rad(self.rotation))
-        restd2 = (self.d - abs(self.left_radius) - abs(self.right_radius)) / 2
-
-        d2cos_left = (abs(self.left_radius) + restd2)  * cos(deg2rad(self.rotation))
-        d2sin_left = (abs(self.left_radius) + restd2) * sin(deg2rad(self.rotation))
-        d2cos_right = (abs(self.right_radius) + restd2) * cos(deg2rad(self.rotation))
-        d2sin_right = (abs(self.right_radius) + restd2) * sin(deg2rad(self.rotation))
-
-        self._vertices = {
-            "top-left": round_point(Point2D(self.pos.x - d2cos_left - height2sin, self.pos.y - d2sin_left + height2cos)),
-            "top-right": round_point(Point2D(self.pos.x + d2cos_right - height2sin, self.pos.y + d2sin_right + height2cos)),
-            "bottom-right": round_point(Point2D(self.pos.x + d2cos_right + height2sin, self.pos.y + d2sin_right - height2cos)),
-            "bottom-left": round_point(Point2D(self.pos.x - d2cos_left + height2sin, self.pos.y - d2sin_left - height2cos)),
-        }
-
-        print("Vertices:", self._vertices)
+        self._vertices = {name: vec2point(vertex) for name, vertex in zip(LenController.VERTICES,
+                                                                         self._float_vertices)}
+        if log.debug:
+            log.event("vertices", vertices=self._vertices)
 
     @property
     def sides(self) -> dict:
+        if self._sides is None:
+            self.calc_sides()
         return self._sides
 
     def calc_sides(self):
@@ -190,69 +258,95 @@ class LenController(BasicController):
 
     @property
     def curve_vertices(self) -> dict:
+        if self._curve_vertices is None:
+            self.calc_curve_vertices()
         return self._curve_vertices
 
     def calc_curve_vertices(self):
-        h2sin = (self.height / 2) * sin(self.rotation)
-        h2cos = (self.height / 2) * cos(self.rotation)
-        rest_d2 = (self.d - abs(self.left_radius) - abs(self.right_radius)) / 2
-
-        left_shift = abs(self.left_radius) + rest_d2 if self.left_radius < 0 else rest_d2
-        d2rest_cos_left = left_shift * cos(self.rotation)
-        d2rest_sin_left = left_shift * sin(self.rotation)
-
-        right_shift = abs(self.right_radius) + rest_d2 if self.right_radius < 0 else rest_d2
-        d2rest_cos_right = right_shift * cos(self.rotation)
-        d2rest_sin_right = right_shift * sin(self.rotation)
-
-        result = {  # Stores middle top/bottom points of curves
-            "left-top": Point2D(
-                self.pos.x - d2rest_cos_left - h2sin,
-                self.pos.y - d2rest_sin_left + h2cos),
-            "left-bottom": Point2D(self.pos.x - d2rest_cos_left + h2sin, self.pos.y - d2rest_sin_left - h2cos),
-            "right-top": Point2D(self.pos.x + d2rest_cos_right - h2sin, self.pos.y + d2rest_sin_right + h2cos),
-            "right-bottom": Point2D(self.pos.x + d2rest_cos_right + h2sin, self.pos.y + d2rest_sin_right - h2cos),
-        }
-        for key, point in result.items():
-            result[key] = round_point(point)
-        print(result)
-        self._curve_vertices = result
-
-        print("Curve vertices:", self._curve_vertices)
+        # Stores middle top/bottom points of curves
+        self._curve_vertices = {name: vec2point(vertex) for name, vertex in zip(LenController.CURVE_VERTICES,
+                                                                               self._float_curve_vertices)}
+        if log.debug:
+            log.event("curve_vertices", curve_vertices=self._curve_vertices)
 
     @property
     def left_curve(self):
+        if self._left_curve is None:
+            self.calc_left_curve()
         return self._left_curve
 
     def calc_left_curve(self):
         pos_x, pos_y = self.curve_vertices["left-top"].midpoint(self.curve_vertices["left-bottom"])
         h_radius = abs(self.left_radius)
         v_radius = self.curve_vertices["left-top"].distance(self.curve_vertices["left-bottom"])
-        theta = tan(self.rotation)
-        print(f"Left curve: pos=({pos_x}, {pos_y}), h_radius={h_radius}, v_radius={v_radius}, theta={theta}")
+        theta = tan(deg2rad(self.rotation))
+        if log.debug:
+            log.event("left_curve", pos=(pos_x, pos_y), h_radius=h_radius, v_radius=v_radius, theta=theta)
         self._left_curve = Solver.calc_ellipse_eq(pos_x, pos_y, h_radius, v_radius, theta)
 
     @property
     def right_curve(self):
+        if self._right_curve is None:
+            self.calc_right_curve()
         return self._right_curve
 
     def calc_right_curve(self):
         pos_x, pos_y = self.curve_vertices["right-top"].midpoint(self.curve_vertices["right-bottom"])
         h_radius = abs(self.right_radius)
         v_radius = self.curve_vertices["right-top"].distance(self.curve_vertices["right-bottom"])
-        theta = tan(self.rotation)
-        print(f"Right curve: pos=({pos_x}, {pos_y}), h_radius={h_radius}, v_radius={v_radius}, theta={theta}")
+        theta = tan(deg2rad(self.rotation))
+        if log.debug:
+            log.event("right_curve", pos=(pos_x, pos_y), h_radius=h_radius, v_radius=v_radius, theta=theta)
         self._right_curve = Solver.calc_ellipse_eq(pos_x, pos_y, h_radius, v_radius, theta)
 
+    @property
+    def thickness(self) -> float:
+        return self.d / 100  # Assuming thickness [m] is the width of the lens
+
+    @property
+    def float_curves(self) -> list[tuple]:
+        return self._float_curves
+
+    @property
+    def bounds(self) -> tuple[float, float, float, float] | None:
+        return self._bounds
+
+    def calc_float_curves(self):
+        """
+        Converts both curves to float ellipse parameters used by the numeric engine.
+        Each entry holds the center, radii, rotation, clipping polygon and normal orientation
+        (1 when the material lies inside the ellipse, -1 for concave sides).
+        """
+        left_top, left_bottom, right_top, right_bottom = self._float_curve_vertices
+        top_left, top_right, bottom_right, bottom_left = self._float_vertices
+        self._float_curves = []
+        for radius, top, bottom, polygon in ((self.left_radius, left_top, left_bottom, [top_left, bottom_left]),
+                                             (self.right_radius, right_top, right_bottom, [top_right, bottom_right])):
+            if radius >= 0:
+                polygon = polygon + [bottom, top]
+            else:
+                polygon = [top_left, bottom_left, bottom_right, top_right]
+            self._float_curves.append((
+                Vec2((top.x + bottom.x) / 2, (top.y + bottom.y) / 2),
+                float(abs(radius)),
+                hypot(top.x - bottom.x, top.y - bottom.y),
+                radians(self.rotation),
+                polygon,
+                1 if radius >= 0 else -1
+            ))
+        xs = [vertex.x for vertex in self._float_vertices]
+        ys = [vertex.y for vertex in self._float_vertices]
+        self._bounds = (min(xs), min(ys), max(xs), max(ys))
+
     def scale(self, scale_factor: float):
         """
         Scales the dimensions of the len.
         """
-        self.d *= scale_factor
-        self.height *= scale_factor
-        self.left_radius *= scale_factor
-        self.right_radius *= scale_factor
-        self.update_props()
+        with self.batch():
+            self.d *= scale_factor
+            self.height *= scale_factor
+            self.left_radius *= scale_factor
+            self.right_radius *= scale_factor
 
     @property
     def pos(self) -> Point2D:
@@ -260,8 +354,8 @@ class LenController(BasicController):
 
     @pos.setter
     def pos(self, point: Point2D):
-        self._pos = point
-        self.update_props()
+        with self.batch():
+            self._pos = point
 
     @property
     def height(self) -> float:
@@ -269,8 +363,8 @@ class LenController(BasicController):
 
     @height.setter
     def height(self, height: float):
-        self._height = height
-        self.update_props()
+        with self.batch():
+            self._height = height
 
     @property
     def rotation(self) -> float:
@@ -278,8 +372,8 @@ class LenController(BasicController):
 
     @rotation.setter
     def rotation(self, rotation: float):
-        self._rotation = rotation
-        self.update_props()
+        with self.batch():
+            self._rotation = rotation
 
     @property
     def d(self) -> float:
@@ -287,12 +381,8 @@ class LenController(BasicController):
 
     @d.setter
     def d(self, d: float):
-        if d < self.left_radius + self.right_radius:
-            raise ValueError("The thickness of the lens must be greater than the sum of the radii.")
-        if d < 0:
-            raise ValueError("The thickness of the lens must be a positive value.")
-        self._d = d
-        self.update_props()
+        with self.batch():
+            self._d = d
 
     @property
     def left_radius(self) -> float:
@@ -300,8 +390,8 @@ class LenController(BasicController):
 
     @left_radius.setter
     def left_radius(self, radius: float):
-        self._left_radius = radius
-        self.update_props()
+        with self.batch():
+            self._left_radius = radius
 
     @property
     def right_radius(self) -> float:
@@ -309,5 +399,5 @@ class LenController(BasicController):
 
     @right_radius.setter
     def right_radius(self, radius: float):
-        self._right_radius = radius
-        self.update_props()
+        with self.batch():
+            self._right_radius = radius
@@ -1,9 +1,23 @@
+import numpy as np
+
+
 class Material:
     """
     The `Material` class allows the creation of materials with unique properties.
+
+    `refractive_index` is the index at `REFERENCE_WAVELENGTH`, used for rays without a wavelength.
+    Dispersive materials also describe n(λ), see `refractive_index_at`, either by Sellmeier
+    coefficients or by a Cauchy fit of the Abbe number.
     """
 
-    def __init__(self, transparency, refractive_index, absorption_coefficient):
+    # Wavelength [nm] of the helium d line, the refractive index and the Abbe number are given for it
+    REFERENCE_WAVELENGTH = 587.56
+    # Wavelengths [nm] of the hydrogen F and C lines, which define the Abbe number
+    F_LINE, C_LINE = 486.13, 656.27
+    # Bumped by every change of an optical property of any material, see `Solver.changes_since`
+    version = 0
+
+    def __init__(self, transparency, refractive_index, absorption_coefficient, sellmeier=None):
         """
         Initializes an instance of the `Material` class.
 
@@ -15,10 +29,18 @@ class Material:
 
         :param absorption_coefficient: Absorption coefficient of the material [m⁻¹]
         :type absorption_coefficient: float
+
+        :param sellmeier: Sellmeier coefficients (B, C [µm²]) of every term, None for a Cauchy model or no dispersion
+        :type sellmeier: tuple[tuple[float, float], ...] | None
         """
         self._transparency = transparency
         self._refractive_index = refractive_index
         self._absorption_coefficient = absorption_coefficient
+        self._sellmeier = sellmeier
+        self._abbe_number = 0.0
+        self._cauchy: tuple[float, float] | None = None  # (A, B [nm²]) fitted to the Abbe number
+        # (n1, n2, mu, thickness) -> angle independent terms of a surface, see `Solver.interface`
+        self.interface_cache: dict[tuple[float, float, float, float], tuple[float, float, float]] = {}
 
     @property
     def transparency(self):
@@ -35,6 +57,70 @@ class Material:
     @refractive_index.setter
     def refractive_index(self, value):
         self._refractive_index = value
+        self._cauchy = Material.fit_cauchy(value, self._abbe_number)
+        self.interface_cache.clear()
+        Material.version += 1
+
+    @property
+    def sellmeier(self):
+        return self._sellmeier
+
+    @sellmeier.setter
+    def sellmeier(self, value):
+        self._sellmeier = value
+        self.interface_cache.clear()
+        Material.version += 1
+
+    @property
+    def abbe_number(self):
+        """
+        Abbe number of the Cauchy model, 0 when the material is not dispersive or uses Sellmeier coefficients.
+        """
+        return self._abbe_number
+
+    @abbe_number.setter
+    def abbe_number(self, value):
+        self._abbe_number = value
+        self._cauchy = Material.fit_cauchy(self._refractive_index, value)
+        self.interface_cache.clear()
+        Material.version += 1
+
+    @property
+    def is_dispersive(self) -> bool:
+        return self._sellmeier is not None or self._cauchy is not None
+
+    def refractive_index_at(self, wavelength):
+        """
+        Calculates the refractive index for light of the given wavelength.
+        Sellmeier coefficients take precedence over the Abbe number.
+
+        :param wavelength: Wavelength [nm], a number or an array, 0 for `refractive_index`
+        :return: Refractive index of the same shape as `wavelength`
+        """
+        wavelength = np.asarray(wavelength, dtype=float)
+        if not self.is_dispersive:
+            return np.full(wavelength.shape, float(self._refractive_index))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if self._sellmeier is not None:
+                squared = (wavelength / 1000) ** 2  # The coefficients are given for micrometers
+                index = np.sqrt(1 + sum(b * squared / (squared - c) for b, c in self._sellmeier))
+            else:
+                a, b = self._cauchy
+                index = a + b / wavelength ** 2
+        return np.where(wavelength > 0, index, float(self._refractive_index))
+
+    @staticmethod
+    def fit_cauchy(refractive_index: float, abbe_number: float) -> tuple[float, float] | None:
+        """
+        Fits the two-term Cauchy equation n(λ) = A + B / λ² to the index at `REFERENCE_WAVELENGTH`
+        and the Abbe number V = (n_d - 1) / (n_F - n_C).
+
+        :return: Coefficients (A, B [nm²]), None when the Abbe number is 0
+        """
+        if not abbe_number:
+            return None
+        b = (refractive_index - 1) / (abbe_number * (Material.F_LINE ** -2 - Material.C_LINE ** -2))
+        return refractive_index - b / Material.REFERENCE_WAVELENGTH ** 2, b
 
     @property
     def absorption_coefficient(self):
@@ -43,6 +129,8 @@ class Material:
     @absorption_coefficient.setter
     def absorption_coefficient(self, value):
         self._absorption_coefficient = value
+        self.interface_cache.clear()
+        Material.version += 1
 
     @staticmethod
     def glass():
@@ -54,3 +142,13 @@ class Material:
         """
         return Material(100, 1.5, 0.001)
 
+    @staticmethod
+    def bk7():
+        """
+        Returns a material with the properties of the borosilicate crown glass N-BK7.
+
+        - Transparency: 100%
+        - Refractive index: 1.5168, dispersion from the Sellmeier coefficients of the Schott catalog
+        """
+        return Material(100, 1.5168, 0.001, sellmeier=((1.03961212, 0.00600069867), (0.231792344, 0.0200179144),
+                                                        (1.01046945, 103.560653)))
@@ -1,9 +1,12 @@
-from PyQt6.QtCore import QPointF
-from sympy import Point2D, cos, sin, Segment2D, Ray
+from math import cos, sin, radians
+from typing import NamedTuple
+
+from sympy import Point2D, Segment2D, Ray, Line2D
 from .BasicController import BasicController
 from .Material import Material
+from .NumericSolver import NumericSolver
 from .Solver import Solver
-from .util import deg2rad, round_point, round_segment, round_line, is_point_inside_polygon
+from .util import round_and_float, round_point, round_line, is_point_inside_polygon, vec2point, Vec2, QPointF
 
 
 class MirrorController(BasicController):
@@ -14,6 +17,20 @@ class MirrorController(BasicController):
     DEF_WIDTH = 20
     DEF_HEIGHT = 60
 
+    # Names of the vertices and of the sides between them, in the order of `Geometry.vertices` and `Geometry.edges`
+    VERTICES = ("top-left", "top-right", "bottom-right", "bottom-left")
+    SIDES = {"left": (0, 3), "right": (1, 2), "top": (0, 1), "bottom": (3, 2)}
+
+    class Geometry(NamedTuple):
+        """
+        Immutable float snapshot of the mirror, rebuilt only when its position, rotation or size change.
+        """
+        vertices: tuple[Vec2, ...]  # Rounded like the SymPy vertices, see `MirrorController.VERTICES`
+        edges: tuple[tuple[Vec2, Vec2, Vec2], ...]  # (start, end, outward unit normal), see `MirrorController.SIDES`
+        edge_vectors: tuple[Vec2, ...]  # end - start of every edge
+        bounds: tuple[float, float, float, float]
+        transform: tuple[tuple[float, float, float], tuple[float, float, float]]  # Local to scene affine matrix
+
     def __init__(self, x: float, y: float, width: float = DEF_WIDTH, height: float = DEF_HEIGHT):
         """
         Initializes an instance of the `Mirror` class.
@@ -24,57 +41,66 @@ class MirrorController(BasicController):
         :param height: Height of the mirror
         """
         self._pos = Point2D(x, y)
-        self.width = width
-        self.height = height
+        self._width = width
+        self._height = height
         self._rotation = 0
-        self._vertices = {}
-        self._sides = {}
+        self._geometry: MirrorController.Geometry | None = None
+        self._vertices = None  # SymPy counterparts of the geometry, built on first use by the SymPy engine
+        self._sides = None
+        self._side_normals = None
+        self._bounds = None
+        self._dirty = True
         self.material: Material = Material.glass()
         self.update_props()
-        Solver.optical_objects.append(self)
+        Solver.add_object(self)
 
     def get_collision(self, ray: Ray) -> dict[str, Point2D | Segment2D | Material | bool] | None:
         intersections = []
-        for side in self.sides.values():
+        for name, side in self.sides.items():
             if intersection_point := Solver.first_intersection(ray,side):
-                intersections.append({"point": round_point(intersection_point), "side": side})
-        intersections = [cp for cp in intersections if cp["point"] != round_point(ray.source)]
+                intersections.append({"point": round_point(intersection_point), "side": name})
+        source = round_point(ray.source)
+        intersections = [cp for cp in intersections if cp["point"] != source]
         if intersections:
-            closest_intersection = min(intersections, key=lambda cp: cp["point"].distance(ray.source))
+            closest_intersection = min(intersections, key=lambda cp: cp["point"].distance(source))
             return {
-                "surface": closest_intersection["side"],
+                "surface": self.sides[closest_intersection["side"]],
                 "point": closest_intersection["point"],
-                "normal": round_line(closest_intersection["side"].perpendicular_line(closest_intersection["point"])),
+                # The normal of a side has the same direction at every point, only its angle is used
+                "normal": self.side_normals[closest_intersection["side"]],
+                "object": self,
                 "material": self.material,
-                "is-from-inside": self.is_point_inside(ray.source),
-                "thickness": self.width/100 # Assuming thickness [m] is the width of the mirror,
+                "thickness": self.thickness  # `Solver` knows whether the ray travels inside
             }
         return None
 
+    def get_numeric_collision(self, origin: Vec2, direction: Vec2) -> dict | None:
+        return NumericSolver.edge_collision(self, origin, direction, self.geometry.edges)
+
     def is_point_inside(self, point: Point2D | QPointF) -> bool:
         """
         Checks if a point is inside the mirror's area.
 
         :param point: The point to check
-        :type point: Point2D or QPointF
+        :type point: Point2D, Vec2 or QPointF
         :return: True if the point is inside, False otherwise
         """
         if isinstance(point, QPointF):
-            point = Point2D(point.x(), point.y())
-        polygon = [
-            self.vertices["top-left"],
-            self.vertices["top-right"],
-            self.vertices["bottom-right"],
-            self.vertices["bottom-left"]
-        ]
-        return is_point_inside_polygon(point, polygon)
+            point = (point.x(), point.y())
+        else:
+            point = (float(point.x), float(point.y))
+        return is_point_inside_polygon(point, self.geometry.vertices)
 
     def update_props(self):
         """
-        Updates the properties of the mirror, recalculating its props
+        Updates the properties of the mirror, recalculating its geometry when the position, rotation or size changed
         """
-        self.calc_vertices()
-        self.calc_sides()
+        if not self._dirty:
+            return
+        old_bounds = self.bounds
+        self._bounds = self.geometry.bounds
+        self._dirty = False
+        Solver.object_changed(self, old_bounds)
 
     @property
     def pos(self) -> Point2D:
@@ -84,7 +110,10 @@ class MirrorController(BasicController):
     def pos(self, value: Point2D | QPointF):
         if isinstance(value, QPointF):
             value = Point2D(value.x(), value.y())
-        self._pos = value
+        if value != self._pos:
+            self._pos = value
+            self._geometry = None
+            self._dirty = True
 
     @property
     def rotation(self):
@@ -92,33 +121,101 @@ class MirrorController(BasicController):
 
     @rotation.setter
     def rotation(self, value: float):
-        self._rotation = value
+        if value != self._rotation:
+            self._rotation = value
+            self._geometry = None
+            self._dirty = True
 
     @property
-    def vertices(self):
-        return self._vertices
+    def width(self) -> float:
+        return self._width
 
-    def calc_vertices(self):
-        width2cos = (self.width / 2) * cos(deg2rad(self.rotation))
-        width2sin = (self.width / 2) * sin(deg2rad(self.rotation))
-        height2cos = (self.height / 2) * cos(deg2rad(self.rotation))
-        height2sin = (self.height / 2) * sin(deg2rad(self.rotation))
-        self._vertices = {
-            "top-left": round_point(Point2D(self.pos.x - width2cos - height2sin, self.pos.y - width2sin + height2cos)),
-            "top-right": round_point(Point2D(self.pos.x + width2cos - height2sin, self.pos.y + width2sin + height2cos)),
-            "bottom-right": round_point(Point2D(self.pos.x + width2cos + height2sin, self.pos.y + width2sin - height2cos)),
-            "bottom-left": round_point(Point2D(self.pos.x - width2cos + height2sin, self.pos.y - width2sin - height2cos)),
-        }
+    @width.setter
+    def width(self, value: float):
+        if value != self._width:
+            self._width = value
+            self._geometry = None
+            self._dirty = True
 
     @property
-    def sides(self):
+    def height(self) -> float:
+        return self._height
+
+    @height.setter
+    def height(self, value: float):
+        if value != self._height:
+            self._height = value
+            self._geometry = None
+            self._dirty = True
+
+    @property
+    def geometry(self) -> 'MirrorController.Geometry':
+        if self._geometry is None:
+            self.calc_geometry()
+        return self._geometry
+
+    def calc_geometry(self):
+        """
+        Rebuilds the float snapshot of the mirror and drops the SymPy vertices and sides derived from it.
+        """
+        angle = radians(self.rotation)
+        c, s = cos(angle), sin(angle)
+        transform = ((c, -s, float(self.pos.x)), (s, c, float(self.pos.y)))
+        (a, b, x), (d, e, y) = transform
+        half_width, half_height = self.width / 2, self.height / 2
+        vertices = tuple(Vec2(round_and_float(x + a * u + b * v), round_and_float(y + d * u + e * v))
+                         for u, v in ((-half_width, half_height), (half_width, half_height),
+                                      (half_width, -half_height), (-half_width, -half_height)))
+        edges, edge_vectors = [], []
+        for start, end in MirrorController.SIDES.values():
+            p1, p2 = vertices[start], vertices[end]
+            edge = Vec2(p2.x - p1.x, p2.y - p1.y)
+            length = (edge.x ** 2 + edge.y ** 2) ** 0.5
+            normal = Vec2(edge.y / length, -edge.x / length)
+            if normal.x * ((p1.x + p2.x) / 2 - x) + normal.y * ((p1.y + p2.y) / 2 - y) < 0:
+                normal = Vec2(-normal.x, -normal.y)
+            edges.append((p1, p2, normal))
+            edge_vectors.append(edge)
+        xs, ys = [vertex.x for vertex in vertices], [vertex.y for vertex in vertices]
+        self._geometry = MirrorController.Geometry(vertices, tuple(edges), tuple(edge_vectors),
+                                                   (min(xs), min(ys), max(xs), max(ys)), transform)
+        self._vertices = self._sides = self._side_normals = None
+
+    @property
+    def vertices(self) -> dict[str, Point2D]:
+        if self._vertices is None:
+            self._vertices = {name: vec2point(vertex) for name, vertex in zip(MirrorController.VERTICES,
+                                                                             self.geometry.vertices)}
+        return self._vertices
+
+    @property
+    def sides(self) -> dict[str, Segment2D]:
+        if self._sides is None:
+            vertices = self.vertices
+            self._sides = {name: Segment2D(vertices[MirrorController.VERTICES[start]],
+                                           vertices[MirrorController.VERTICES[end]])
+                           for name, (start, end) in MirrorController.SIDES.items()}
         return self._sides
 
-    def calc_sides(self):
-        vertices = self.vertices
-        self._sides = {
-            "left": round_segment(Segment2D(vertices["top-left"], vertices["bottom-left"])),
-            "right": round_segment(Segment2D(vertices["top-right"], vertices["bottom-right"])),
-            "top": round_segment(Segment2D(vertices["top-left"], vertices["top-right"])),
-            "bottom": round_segment(Segment2D(vertices["bottom-left"], vertices["bottom-right"])),
-        }
+    @property
+    def side_normals(self) -> dict[str, Line2D]:
+        """
+        Lines perpendicular to the sides, used by the SymPy engine for the angle of the normal.
+        """
+        if self._side_normals is None:
+            self._side_normals = {name: round_line(side.perpendicular_line(side.p1))
+                                  for name, side in self.sides.items()}
+        return self._side_normals
+
+    @property
+    def thickness(self) -> float:
+        return self.width / 100  # Assuming thickness [m] is the width of the mirror
+
+    @property
+    def float_edges(self) -> tuple[tuple[Vec2, Vec2, Vec2], ...]:
+        return self.geometry.edges
+
+    @property
+    def bounds(self) -> tuple[float, float, float, float] | None:
+        # Bounds known to the solver, they only follow the geometry in `update_props`
+        return self._bounds
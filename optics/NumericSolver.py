@@ -0,0 +1,292 @@
+from math import sqrt, cos, sin, inf
+
+from conf import RAY_MAX_LENGTH, MAX_REFRACTIONS, IS_REFLECTION, IS_REFRACTION
+from optics.BoundingVolumeHierarchy import BoundingVolumeHierarchy
+from optics.Profiler import Profiler
+from optics.RayQueue import RayQueue
+from optics.RayPath import RayPath
+from optics.Solver import Solver
+from optics.TraceLog import TraceLog
+from optics.util import Vec2
+
+log = TraceLog.channel("numeric")
+
+
+class NumericSolver:
+    """
+    Float based counterpart of `Solver`.
+    Traces rays with plain float arithmetic instead of SymPy geometry and writes
+    the segments straight into a compact `RayPath`.
+    """
+
+    # Minimal distance along the ray for a hit to count, prevents re-hitting the surface the ray starts on
+    EPSILON = 1e-6
+
+    @staticmethod
+    def find_first_collision(origin: Vec2, direction: Vec2) -> dict | None:
+        """
+        Detects the nearest collision of a ray with optical objects.
+        :param origin: The ray source point
+        :param direction: The unit direction vector of the ray
+        :return: Collision data of the nearest hit or None
+        """
+        with Profiler.stage("collision"):
+            nearest = None
+            tests = 0
+            for entry, obj in Solver.candidate_objects(origin, direction):
+                if nearest is not None and entry > nearest["distance"]:
+                    break  # Candidates are sorted, the remaining boxes start behind the nearest hit
+                tests += 1
+                collision = obj.get_numeric_collision(origin, direction)
+                if collision and (nearest is None or collision["distance"] < nearest["distance"]):
+                    nearest = collision
+            Profiler.count("intersection_tests", tests)
+            return nearest
+
+    class Trace:
+        """
+        Result of tracing one ray together with the log needed to resume it.
+        `entries` hold, for every segment in `path`, the hit object (None when the ray hit nothing)
+        and the child rays offered to the queue, including those it rejected.
+        """
+        __slots__ = ("origin", "direction", "path", "entries")
+
+        def __init__(self, origin: Vec2, direction: Vec2):
+            self.origin = origin
+            self.direction = direction
+            self.path = RayPath()
+            self.entries = []
+
+    @staticmethod
+    def get_path(origin: Vec2, direction: Vec2) -> RayPath:
+        """
+        Traces the ray and all of its reflected and refracted children.
+        :param origin: The ray source point
+        :param direction: The unit direction vector of the ray
+        :return: Path segments
+        """
+        return NumericSolver.trace(origin, direction).path
+
+    @staticmethod
+    def trace(origin: Vec2, direction: Vec2, previous: 'NumericSolver.Trace' = None,
+              start: int = 0) -> 'NumericSolver.Trace':
+        """
+        Traces the ray, brightest branches first, optionally reusing the first `start` entries
+        of a previous trace of the same ray.
+        :param origin: The ray source point
+        :param direction: The unit direction vector of the ray
+        :param previous: Earlier trace of the same ray
+        :param start: Number of entries of `previous` to keep
+        """
+        Profiler.count("rays")
+        result = NumericSolver.Trace(origin, direction)
+        queue = RayQueue(MAX_REFRACTIONS + 1)
+        queue.push((origin, direction), 255)  # Initial ray with alpha color 255
+        if previous is not None and start:
+            # Replay the kept entries, the queue is seeded, so it rejects and orders the children as before
+            for index, (_, children) in enumerate(previous.entries[:start]):
+                if queue.pop() is None:  # The time budget ran out meanwhile
+                    start = index
+                    break
+                for child_origin, child_direction, alpha in children:
+                    queue.push((child_origin, child_direction), alpha)
+            result.entries = previous.entries[:start]
+            result.path = previous.path.prefix(start)
+        i = start
+        while (item := queue.pop()) is not None:
+            i += 1
+            (ray_origin, ray_direction), alpha = item
+            children = []
+            if collision := NumericSolver.find_first_collision(ray_origin, ray_direction):
+                end, obj = collision["point"], collision["object"]
+                with Profiler.stage("reflect_refract"):
+                    if IS_REFLECTION and (child := NumericSolver.compute_ray_reflection(ray_direction, collision,
+                                                                                        alpha)):
+                        children.append(child)
+                    if IS_REFRACTION and (child := NumericSolver.compute_ray_refraction(ray_direction, collision,
+                                                                                        alpha)):
+                        children.append(child)
+            else:
+                end, obj = NumericSolver.get_ray_inf_point(ray_origin, ray_direction), None
+            if log.debug:
+                log.event("bounce", iteration=i, start=ray_origin, end=end, alpha=alpha, object=obj,
+                          children=len(children))
+            Profiler.count("bounces")
+            result.entries.append((obj, tuple(children)))
+            result.path.append(ray_origin.x, ray_origin.y, end.x, end.y, alpha)
+            for child_origin, child_direction, child_alpha in children:
+                queue.push((child_origin, child_direction), child_alpha)
+        return result
+
+    @staticmethod
+    def retrace(previous: 'NumericSolver.Trace',
+                changed_regions: list[tuple[float, float, float, float] | None]) -> 'NumericSolver.Trace':
+        """
+        Updates a trace after objects changed, recomputing only from the first segment
+        that crosses a changed region. Everything before it is reused.
+        :param previous: Earlier trace of the ray
+        :param changed_regions: Old and new bounds of the changed objects, None forces a full trace
+        :return: The updated trace, `previous` itself when no segment is affected
+        """
+        if any(region is None for region in changed_regions):
+            return NumericSolver.trace(previous.origin, previous.direction)
+        for index, (obj, _) in enumerate(previous.entries):
+            start_x, start_y, end_x, end_y, _ = previous.path.segment(index)
+            start, delta = Vec2(start_x, start_y), Vec2(end_x - start_x, end_y - start_y)
+            # A ray that hit nothing is unbounded, objects beyond the drawn end may now be in its way
+            length = 1 if obj is not None else inf
+            if any(BoundingVolumeHierarchy.ray_box_entry(start, delta, region, length) is not None
+                   for region in changed_regions):
+                return NumericSolver.trace(previous.origin, previous.direction, previous, index)
+        return previous
+
+    @staticmethod
+    def refractive_indices(collision: dict) -> tuple[float, float]:
+        """
+        Returns refractive indices (n1, n2) on both sides of the hit surface.
+        """
+        if collision["is-from-inside"]:
+            return collision["material"].refractive_index, 1
+        return 1, collision["material"].refractive_index
+
+    @staticmethod
+    def compute_ray_reflection(direction: Vec2, collision: dict, alpha_primary: float) -> tuple | None:
+        n1, n2 = NumericSolver.refractive_indices(collision)
+        _, surface_transmission = Solver.interface_factors(collision["material"], n1, n2, collision["thickness"],
+                                                           NumericSolver.cos_incidence(direction, collision["normal"]))
+        alpha_color = alpha_primary - alpha_primary * surface_transmission
+        return collision["point"], NumericSolver.reflect(direction, collision["normal"]), alpha_color
+
+    @staticmethod
+    def compute_ray_refraction(direction: Vec2, collision: dict, alpha_primary: float) -> tuple | None:
+        n1, n2 = NumericSolver.refractive_indices(collision)
+        new_direction = NumericSolver.refract(direction, collision["normal"], n1, n2)
+        if new_direction is None:  # Total internal reflection
+            return None
+        transmission, _ = Solver.interface_factors(collision["material"], n1, n2, collision["thickness"],
+                                                   NumericSolver.cos_incidence(direction, collision["normal"]))
+        alpha_color = alpha_primary * transmission
+        return collision["point"], new_direction, alpha_color
+
+    @staticmethod
+    def reflect(direction: Vec2, normal: Vec2) -> Vec2:
+        """
+        Mirrors the direction vector about the surface normal.
+        :param direction: Unit direction of the incident ray
+        :param normal: Unit normal of the surface
+        :return: Unit direction of the reflected ray
+        """
+        dot = direction.x * normal.x + direction.y * normal.y
+        return Vec2(direction.x - 2 * dot * normal.x, direction.y - 2 * dot * normal.y)
+
+    @staticmethod
+    def cos_incidence(direction: Vec2, normal: Vec2) -> float:
+        """
+        Cosine of the angle between the ray and the surface normal, either orientation.
+        """
+        return abs(direction.x * normal.x + direction.y * normal.y)
+
+    @staticmethod
+    def refract(direction: Vec2, normal: Vec2, n1: float, n2: float) -> Vec2 | None:
+        """
+        Refracts the direction vector using the vector form of Snell's law.
+        :param direction: Unit direction of the incident ray
+        :param normal: Unit normal of the surface, either orientation
+        :param n1: Refractive index of the medium the ray comes from
+        :param n2: Refractive index of the medium the ray enters
+        :return: Unit direction of the refracted ray or None on total internal reflection
+        """
+        cos_i = -(direction.x * normal.x + direction.y * normal.y)
+        if cos_i < 0:  # Orient the normal against the incident ray
+            normal = Vec2(-normal.x, -normal.y)
+            cos_i = -cos_i
+        eta = n1 / n2
+        k = 1 - eta ** 2 * (1 - cos_i ** 2)
+        if k < 0:
+            return None
+        factor = eta * cos_i - sqrt(k)
+        return Vec2(eta * direction.x + factor * normal.x, eta * direction.y + factor * normal.y)
+
+    @staticmethod
+    def edge_collision(obj, origin: Vec2, direction: Vec2, edges) -> dict | None:
+        """
+        Detects the nearest collision of a ray with flat surfaces of an object.
+        :param obj: The object, provides `material` and `thickness`
+        :param edges: (start, end, outward unit normal) of every surface
+        :return: Collision data, see `BasicController.get_numeric_collision`, or None
+        """
+        nearest_distance, nearest_normal = None, None
+        for p1, p2, normal in edges:
+            distance = NumericSolver.intersect_segment(origin, direction, p1, p2)
+            if distance is not None and (nearest_distance is None or distance < nearest_distance):
+                nearest_distance, nearest_normal = distance, normal
+        if nearest_distance is None:
+            return None
+        return {
+            "point": Vec2(origin.x + nearest_distance * direction.x, origin.y + nearest_distance * direction.y),
+            "normal": nearest_normal,
+            "distance": nearest_distance,
+            "object": obj,
+            "material": obj.material,
+            "is-from-inside": direction.x * nearest_normal.x + direction.y * nearest_normal.y > 0,
+            "thickness": obj.thickness
+        }
+
+    @staticmethod
+    def intersect_segment(origin: Vec2, direction: Vec2, p1: Vec2, p2: Vec2) -> float | None:
+        """
+        Calculates the distance along the ray to the segment.
+        :return: Distance to the hit or None if the ray misses the segment
+        """
+        ex, ey = p2.x - p1.x, p2.y - p1.y
+        denominator = direction.x * ey - direction.y * ex
+        if denominator == 0:  # Parallel
+            return None
+        wx, wy = p1.x - origin.x, p1.y - origin.y
+        t = (wx * ey - wy * ex) / denominator
+        u = (wx * direction.y - wy * direction.x) / denominator
+        if t > NumericSolver.EPSILON and 0 <= u <= 1:
+            return t
+        return None
+
+    @staticmethod
+    def intersect_ellipse(origin: Vec2, direction: Vec2, center: Vec2, h_radius: float, v_radius: float,
+                          angle: float) -> list[float]:
+        """
+        Calculates distances along the ray to a rotated ellipse by solving the quadratic equation.
+        :param center: Center of the ellipse
+        :param h_radius: Radius along the rotated OX axis
+        :param v_radius: Radius along the rotated OY axis
+        :param angle: Rotation of the ellipse in radians
+        :return: Sorted distances of the hits in front of the ray
+        """
+        c, s = cos(angle), sin(angle)
+        rx, ry = origin.x - center.x, origin.y - center.y
+        px, py = rx * c + ry * s, -rx * s + ry * c
+        vx, vy = direction.x * c + direction.y * s, -direction.x * s + direction.y * c
+        a2, b2 = h_radius ** 2, v_radius ** 2
+        qa = vx * vx / a2 + vy * vy / b2
+        qb = 2 * (px * vx / a2 + py * vy / b2)
+        qc = px * px / a2 + py * py / b2 - 1
+        discriminant = qb * qb - 4 * qa * qc
+        if qa == 0 or discriminant < 0:
+            return []
+        root = sqrt(discriminant)
+        roots = ((-qb - root) / (2 * qa), (-qb + root) / (2 * qa))
+        return [t for t in roots if t > NumericSolver.EPSILON]
+
+    @staticmethod
+    def ellipse_normal(point: Vec2, center: Vec2, h_radius: float, v_radius: float, angle: float) -> Vec2:
+        """
+        Calculates the outward unit normal of a rotated ellipse from the gradient of its equation.
+        """
+        c, s = cos(angle), sin(angle)
+        rx, ry = point.x - center.x, point.y - center.y
+        gx, gy = (rx * c + ry * s) / h_radius ** 2, (-rx * s + ry * c) / v_radius ** 2
+        nx, ny = gx * c - gy * s, gx * s + gy * c
+        length = sqrt(nx * nx + ny * ny)
+        return Vec2(nx / length, ny / length)
+
+    @staticmethod
+    def get_ray_inf_point(origin: Vec2, direction: Vec2) -> Vec2:
+        return Vec2(origin.x + RAY_MAX_LENGTH * direction.x, origin.y + RAY_MAX_LENGTH * direction.y)
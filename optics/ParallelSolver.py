@@ -0,0 +1,194 @@
+import multiprocessing
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from math import atan2, ceil
+from typing import Callable
+
+import numpy as np
+from sympy import Ray2D
+
+from optics.BatchSolver import BatchSolver
+from optics.LenController import LenController
+from optics.MirrorController import MirrorController
+from optics.NumericSolver import NumericSolver
+from optics.PolygonController import PolygonController
+from optics.Profiler import Profiler
+from optics.RayPath import RayPath
+from optics.Solver import Solver
+from optics.TraceCache import TraceCache
+from optics.util import Vec2, vec2point
+
+
+class ParallelSolver:
+    """
+    Traces independent lasers concurrently.
+
+    A job is a tuple (engine, origins, directions) describing the rays of one laser, "batch" jobs may
+    add the wavelength of every ray as a fourth element.
+    Jobs of the scalar engines ("sympy", "numeric") run in worker processes, each holding its own copy
+    of the scene rebuilt from a snapshot of the controllers. Jobs of the "batch" engine spend their
+    time in NumPy, so they run on threads sharing the scene of the caller and are split into chunks of rays.
+    Every job returns a `RayPath` of each of its rays. Jobs found in `TraceCache` are not traced again.
+    """
+
+    _processes: Executor | None = None
+    _threads: Executor | None = None
+    _workers = 0
+    _snapshot: list[dict] | None = None
+    _version = 0
+
+    # Scene version currently built in a worker process
+    _worker_version = None
+
+    @staticmethod
+    def trace(jobs: list[tuple], workers: int) -> list[list[RayPath]]:
+        """
+        Traces all jobs in parallel.
+        :param jobs: List of (engine, origins, directions) or ("batch", origins, directions, wavelengths)
+        :param workers: Number of worker processes/threads
+        :return: Segments of every ray of every job, in the order of `jobs`
+        """
+        ParallelSolver.start(workers)
+        snapshot = ParallelSolver.scene_snapshot()
+        if snapshot != ParallelSolver._snapshot:
+            ParallelSolver._snapshot = snapshot
+            ParallelSolver._version += 1
+        if Solver.bvh.is_stale(Solver.optical_objects):
+            Solver.bvh.build(Solver.optical_objects)  # Build once before threads start querying it
+
+        futures, keys, cached = [], [], []
+        for job in jobs:
+            engine, origins, directions, *rest = job
+            keys.append(key := TraceCache.key(job, snapshot))
+            cached.append(TraceCache.get(key))
+            if cached[-1] is not None:
+                futures.append([])
+            elif engine == "batch":
+                wavelengths = rest[0] if rest else None
+                size = max(1, ceil(len(origins) / workers))
+                futures.append([ParallelSolver._threads.submit(
+                    ParallelSolver.trace_job, engine, origins[i:i + size], directions[i:i + size],
+                    wavelengths=None if wavelengths is None else wavelengths[i:i + size])
+                    for i in range(0, len(origins), size)])
+            else:
+                futures.append([ParallelSolver._processes.submit(ParallelSolver._trace_in_worker,
+                                                                 ParallelSolver._version, snapshot, engine,
+                                                                 origins, directions)])
+        results = []
+        for key, paths, chunks in zip(keys, cached, futures):
+            if paths is None:
+                paths = [path for future in chunks for path in future.result()]
+                TraceCache.put(key, paths)
+            results.append(paths)
+        return results
+
+    @staticmethod
+    def start(workers: int):
+        """
+        Creates the worker pools, replacing pools of a different size.
+        Processes are spawned rather than forked, forking a process running Qt is unsafe.
+        """
+        if ParallelSolver._workers == workers:
+            return
+        ParallelSolver.shutdown()
+        ParallelSolver._processes = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                                        initializer=ParallelSolver._init_worker)
+        ParallelSolver._threads = ThreadPoolExecutor(workers)
+        ParallelSolver._workers = workers
+
+    @staticmethod
+    def shutdown():
+        for executor in (ParallelSolver._processes, ParallelSolver._threads):
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        ParallelSolver._processes = ParallelSolver._threads = None
+        ParallelSolver._workers = 0
+
+    @staticmethod
+    def trace_job(engine: str, origins, directions, cancelled: Callable[[], bool] | None = None,
+                  wavelengths=None) -> list[RayPath] | None:
+        """
+        Traces the rays of one job in the current process.
+        :param engine: "sympy", "numeric" or "batch"
+        :param origins: Sequence of (x, y) source points
+        :param directions: Sequence of (x, y) unit directions
+        :param cancelled: Checked while tracing, see `Solver.get_path`
+        :param wavelengths: Sequence of ray wavelengths [nm], only traced by the "batch" engine
+        :return: Segments of every ray, None when cancelled
+        """
+        with Profiler.stage("trace"):
+            if engine == "batch":
+                return BatchSolver.get_paths(np.asarray(origins, dtype=float).reshape(-1, 2),
+                                             np.asarray(directions, dtype=float).reshape(-1, 2), wavelengths)
+            results = []
+            for origin, direction in zip(origins, directions):
+                origin = Vec2(float(origin[0]), float(origin[1]))
+                direction = Vec2(float(direction[0]), float(direction[1]))
+                if engine == "numeric":
+                    path = NumericSolver.get_path(origin, direction)
+                else:
+                    path = Solver.get_path(Ray2D(vec2point(origin), angle=atan2(direction.y, direction.x)),
+                                           cancelled)
+                    path = None if path is None else RayPath.from_dicts(path)
+                if path is None or (cancelled is not None and cancelled()):
+                    return None
+                results.append(path)
+            return results
+
+    @staticmethod
+    def _init_worker():
+        sys.stdout = sys.stderr  # Debug prints of the controllers must not mix with results on standard output
+
+    @staticmethod
+    def _trace_in_worker(version: int, snapshot: list[dict], engine: str, origins, directions):
+        if ParallelSolver._worker_version != version:
+            ParallelSolver.restore_scene(snapshot)
+            ParallelSolver._worker_version = version
+        return ParallelSolver.trace_job(engine, origins, directions)
+
+    @staticmethod
+    def scene_snapshot() -> list[dict]:
+        """
+        Describes the geometry and materials of all optical objects as plain, picklable records.
+        Positions are object centers like in the controllers.
+        """
+        snapshot = []
+        for obj in Solver.optical_objects:
+            if isinstance(obj, MirrorController):
+                record = {"type": "mirror", "width": obj.width, "height": obj.height}
+            elif isinstance(obj, LenController):
+                record = {"type": "lens", "width": obj.d, "height": obj.height, "left_radius": obj.left_radius,
+                          "right_radius": obj.right_radius}
+            elif isinstance(obj, PolygonController):
+                record = {"type": "polygon", "points": obj.points}
+            else:
+                continue
+            record.update(x=float(obj.pos.x), y=float(obj.pos.y), rotation=obj.rotation,
+                          refractive_index=obj.material.refractive_index,
+                          absorption_coefficient=obj.material.absorption_coefficient,
+                          abbe_number=obj.material.abbe_number, sellmeier=obj.material.sellmeier)
+            snapshot.append(record)
+        return snapshot
+
+    @staticmethod
+    def restore_scene(snapshot: list[dict]):
+        """
+        Replaces all optical objects of this process with controllers built from a snapshot.
+        """
+        Solver.clear_objects()
+        for record in snapshot:
+            if record["type"] == "mirror":
+                controller = MirrorController(record["x"], record["y"], record["width"], record["height"])
+                controller.rotation = record["rotation"]
+                controller.update_props()
+            elif record["type"] == "polygon":
+                controller = PolygonController(record["x"], record["y"], record["points"], record["rotation"])
+            else:
+                controller = LenController(record["x"], record["y"], record["width"], record["height"],
+                                           record["left_radius"], record["right_radius"])
+                if record["rotation"]:
+                    controller.rotation = record["rotation"]
+            controller.material.refractive_index = record["refractive_index"]
+            controller.material.absorption_coefficient = record["absorption_coefficient"]
+            controller.material.abbe_number = record["abbe_number"]
+            controller.material.sellmeier = record["sellmeier"]
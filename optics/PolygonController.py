@@ -0,0 +1,152 @@
+from math import cos, sin, radians, sqrt
+
+from sympy import Point2D, Segment2D, Line2D, Ray2D
+
+from conf import LEN_NORMAL_POINTS_DISTANCE, RAY_MAX_LENGTH
+from optics.BasicController import BasicController
+from optics.Material import Material
+from optics.NumericSolver import NumericSolver
+from optics.Solver import Solver
+from optics.util import round_and_float, round_point, is_point_inside_polygon, vec2point, Vec2, QPointF
+
+
+class PolygonController(BasicController):
+    """
+    Dielectric block bounded by a simple polygon, convex or concave.
+    The outline is kept as float edges with outward unit normals, so the numeric engine tests it
+    like a mirror and the batch engine intersects its edges together with the mirror edges.
+    """
+
+    def __init__(self, x: float, y: float, points: list[tuple[float, float]], rotation: float = 0):
+        """
+        :param x: X-coordinate of the center, the pivot of the rotation
+        :param y: Y-coordinate of the center
+        :param points: Vertices relative to the center before the rotation, in either winding order
+        :param rotation: Rotation in degrees
+        """
+        if len(points) < 3:
+            raise ValueError("A polygon needs at least three vertices.")
+        self._pos = Point2D(x, y)
+        self._rotation = rotation
+        self.points = [(float(u), float(v)) for u, v in points]
+        self._float_vertices: tuple[Vec2, ...] = ()
+        self._float_edges: tuple[tuple[Vec2, Vec2, Vec2], ...] = ()
+        self._bounds = None
+        self._dirty = True
+        self.material: Material = Material.glass()
+        self.update_props()
+        Solver.add_object(self)
+
+    def get_collision(self, ray: Ray2D) -> dict[str, Point2D | Segment2D | bool] | None:
+        """
+        Detects the collision of a ray with the polygon using the float edges.
+        """
+        origin = Vec2(float(ray.source.x), float(ray.source.y))
+        dx, dy = float(ray.direction.x), float(ray.direction.y)
+        length = sqrt(dx * dx + dy * dy)
+        direction = Vec2(dx / length, dy / length)
+        if not (collision := self.get_numeric_collision(origin, direction)):
+            return None
+        point = vec2point(collision["point"])
+        if point == round_point(ray.source):
+            return None
+        nx, ny = collision["normal"]
+        x, y = collision["point"]
+        tangent = Vec2(-ny * LEN_NORMAL_POINTS_DISTANCE, nx * LEN_NORMAL_POINTS_DISTANCE)
+        return {
+            "surface": Segment2D(vec2point(Vec2(x - tangent.x, y - tangent.y)),
+                                 vec2point(Vec2(x + tangent.x, y + tangent.y))),
+            "point": point,
+            # Long normal vector keeps the direction precise after rounding
+            "normal": Line2D(point, vec2point(Vec2(x + nx * RAY_MAX_LENGTH, y + ny * RAY_MAX_LENGTH))),
+            "object": self,
+            "material": self.material,
+            "is-from-inside": collision["is-from-inside"],
+            "thickness": self.thickness
+        }
+
+    def get_numeric_collision(self, origin: Vec2, direction: Vec2) -> dict | None:
+        return NumericSolver.edge_collision(self, origin, direction, self._float_edges)
+
+    def is_point_inside(self, point: Point2D | Vec2 | QPointF) -> bool:
+        """
+        Checks if a point is inside the polygon.
+        """
+        if isinstance(point, QPointF):
+            point = (point.x(), point.y())
+        else:
+            point = (float(point.x), float(point.y))
+        return is_point_inside_polygon(point, self._float_vertices)
+
+    def update_props(self):
+        """
+        Recalculates the edges when the position or rotation changed.
+        """
+        if not self._dirty:
+            return
+        old_bounds = self.bounds
+        self.calc_float_edges()
+        self._dirty = False
+        Solver.object_changed(self, old_bounds)
+
+    def calc_float_edges(self):
+        """
+        Places the vertices in the scene and calculates the edges with outward unit normals.
+        """
+        angle = radians(self.rotation)
+        c, s = cos(angle), sin(angle)
+        x, y = float(self.pos.x), float(self.pos.y)
+        vertices = tuple(Vec2(round_and_float(x + u * c - v * s), round_and_float(y + u * s + v * c))
+                         for u, v in self.points)
+        # Positive area means counterclockwise vertices, the outside is then on the right of every edge
+        area = sum(p1.x * p2.y - p2.x * p1.y for p1, p2 in zip(vertices, vertices[1:] + vertices[:1]))
+        orientation = 1 if area > 0 else -1
+        edges = []
+        for p1, p2 in zip(vertices, vertices[1:] + vertices[:1]):
+            length = sqrt((p2.x - p1.x) ** 2 + (p2.y - p1.y) ** 2)
+            if length == 0:
+                continue
+            edges.append((p1, p2, Vec2(orientation * (p2.y - p1.y) / length, orientation * (p1.x - p2.x) / length)))
+        self._float_vertices, self._float_edges = vertices, tuple(edges)
+        xs, ys = [vertex.x for vertex in vertices], [vertex.y for vertex in vertices]
+        self._bounds = (min(xs), min(ys), max(xs), max(ys))
+
+    @property
+    def pos(self) -> Point2D:
+        return self._pos
+
+    @pos.setter
+    def pos(self, value: Point2D | QPointF):
+        if isinstance(value, QPointF):
+            value = Point2D(value.x(), value.y())
+        if value != self._pos:
+            self._pos = value
+            self._dirty = True
+
+    @property
+    def rotation(self) -> float:
+        return self._rotation
+
+    @rotation.setter
+    def rotation(self, value: float):
+        if value != self._rotation:
+            self._rotation = value
+            self._dirty = True
+
+    @property
+    def vertices(self) -> tuple[Vec2, ...]:
+        return self._float_vertices
+
+    @property
+    def thickness(self) -> float:
+        min_u, max_u = min(u for u, _ in self.points), max(u for u, _ in self.points)
+        min_v, max_v = min(v for _, v in self.points), max(v for _, v in self.points)
+        return min(max_u - min_u, max_v - min_v) / 100  # Assuming thickness [m] is the smaller extent
+
+    @property
+    def float_edges(self) -> tuple[tuple[Vec2, Vec2, Vec2], ...]:
+        return self._float_edges
+
+    @property
+    def bounds(self) -> tuple[float, float, float, float] | None:
+        return self._bounds
@@ -1,12 +1,23 @@
-from PyQt6.QtCore import QPointF
+from math import sqrt
 
-from optics.BasicController import BasicController
-from optics.Solver import Solver
+from optics.PolygonController import PolygonController
 
 
-class PrizmController(BasicController):
-    def __init__(self, x: float, y: float, vertices: list[QPointF]):
-        Solver.optical_objects.append(self)
+class PrizmController(PolygonController):
+    """
+    Equilateral triangular prism, a preset of `PolygonController`.
+    """
 
-    def get_collision(self, ray):
-        pass
+    DEF_SIDE = 100
+
+    def __init__(self, x: float, y: float, side: float = DEF_SIDE, rotation: float = 0):
+        """
+        :param x: X-coordinate of the center of the bounding box, like the pivot of `TriangleItem`
+        :param y: Y-coordinate of the center of the bounding box
+        :param side: Length of the sides
+        :param rotation: Rotation in degrees
+        """
+        self.side = side
+        height = side * sqrt(3) / 2
+        # Apex up, the base at the bottom of the bounding box
+        super().__init__(x, y, [(0, height / 2), (side / 2, -height / 2), (-side / 2, -height / 2)], rotation)
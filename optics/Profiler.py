@@ -0,0 +1,111 @@
+import contextlib
+import json
+import threading
+from collections import deque
+from time import perf_counter
+
+from conf import PROFILING
+
+
+class Profiler:
+    """
+    Per-stage timing of refreshes.
+
+    Stages are timed with `with Profiler.stage("collision"):`, counters with `Profiler.count("bounces")`.
+    While disabled a stage only checks a flag, so the hooks can stay in the hot paths.
+    Enabled, every stage adds its duration to the totals of the current refresh and is kept as a span
+    for `export_chrome_trace`, which writes a file readable by chrome://tracing and Perfetto.
+
+    Stages: `update_props` (controllers), `trace` (a whole ray item or job), `collision` (nearest hit search),
+    `reflect_refract` (new rays at a hit), `convert` (segments to cached `QPainterPath`s), `paint` (painting
+    a ray item) and `frame` (a whole repaint of the view).
+    Counters: `rays`, `bounces`, `intersection_tests`.
+    """
+
+    class Stage:
+        __slots__ = ("name", "started")
+
+        def __init__(self, name: str):
+            self.name = name
+            self.started = 0.0
+
+        def __enter__(self):
+            if Profiler.enabled:
+                self.started = perf_counter()
+            return self
+
+        def __exit__(self, *exc_info):
+            if Profiler.enabled and self.started:
+                Profiler.add(self.name, self.started, perf_counter())
+                self.started = 0.0
+
+    PAINT_STAGES = {"paint", "frame"}  # Stages of every repaint, also without a preceding refresh
+
+    enabled = PROFILING
+    spans: deque = deque(maxlen=100000)  # (name, thread id, start [s], end [s])
+    current: dict[str, float] = {}  # Stage times [ms] and counters since the last frame
+    last: dict[str, float] = {}  # Totals of the last refresh, with the times of the latest repaint
+    _lock = threading.Lock()
+    _stages = {}
+    _disabled_stage = contextlib.nullcontext()  # Returned for every stage while the profiler is off
+
+    @staticmethod
+    def stage(name: str) -> 'Profiler.Stage | contextlib.nullcontext':
+        """
+        Returns a context manager timing a stage, a shared no-op one while the profiler is disabled.
+        Stages of other threads are timed separately, so one object per name and thread is reused.
+        """
+        if not Profiler.enabled:
+            return Profiler._disabled_stage
+        key = (name, threading.get_ident())
+        if (stage := Profiler._stages.get(key)) is None or stage.started:
+            stage = Profiler._stages[key] = Profiler.Stage(name)
+        return stage
+
+    @staticmethod
+    def add(name: str, started: float, ended: float):
+        with Profiler._lock:
+            Profiler.current[name] = Profiler.current.get(name, 0.0) + (ended - started) * 1000
+            Profiler.spans.append((name, threading.get_ident(), started, ended))
+
+    @staticmethod
+    def count(name: str, value: int = 1):
+        if Profiler.enabled:
+            with Profiler._lock:
+                Profiler.current[name] = Profiler.current.get(name, 0) + value
+
+    @staticmethod
+    def frame() -> dict[str, float]:
+        """
+        Closes the current frame, called by the view after every repaint.
+        Repaints that did not follow a refresh only update the painting times,
+        so the totals of the last refresh stay available.
+        :return: Totals of the last refresh
+        """
+        with Profiler._lock:
+            if Profiler.current.keys() - Profiler.PAINT_STAGES:
+                Profiler.last = Profiler.current
+            else:
+                Profiler.last = {**Profiler.last, "paint": 0.0, **Profiler.current}
+            Profiler.current = {}
+        return Profiler.last
+
+    @staticmethod
+    def reset():
+        with Profiler._lock:
+            Profiler.spans.clear()
+            Profiler.current, Profiler.last = {}, {}
+
+    @staticmethod
+    def export_chrome_trace(path: str):
+        """
+        Writes the recorded spans in the Chrome trace event format.
+        """
+        with Profiler._lock:
+            spans = list(Profiler.spans)
+        origin = spans[0][2] if spans else 0.0
+        events = [{"name": name, "cat": "optics", "ph": "X", "pid": 0, "tid": thread,
+                   "ts": (started - origin) * 1e6, "dur": (ended - started) * 1e6}
+                  for name, thread, started, ended in spans]
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
@@ -1,7 +1,11 @@
-from PyQt6.QtCore import QPointF
+from math import cos, sin, radians
+
 from sympy import Point2D, pi, Ray as SympyRay
 
+from optics.NumericSolver import NumericSolver
+from optics.RayPath import RayPath
 from optics.Solver import Solver
+from optics.util import Vec2, QPointF
 
 
 class RayController:
@@ -12,6 +16,8 @@ class RayController:
         self._end_point = None
         self._angle_deg = 0.0
         self.ray = SympyRay(self.start_point, angle=self.angle_rad)
+        self._trace = None
+        self._traced_changes = 0  # Number of object changes already applied to the trace, see `Solver.changes_since`
 
     def update_props(self, start_point: QPointF, angle_deg: int):
         self.start_point = Point2D(start_point.x(), start_point.y())
@@ -19,6 +25,23 @@ class RayController:
         self.ray = SympyRay(self.start_point, angle=self.angle_rad)
 
 
+    def get_numeric_path(self) -> RayPath:
+        """
+        Traces the ray with the numeric engine.
+        When only other objects changed since the last call, the path is retraced
+        from the first affected segment and the unaffected prefix is reused.
+        """
+        origin, direction = self.origin, self.direction
+        # Taken before tracing, changes registered meanwhile by another thread are applied on the next call
+        changes, traced_changes = Solver.changes_since(self._traced_changes)
+        trace = self._trace
+        if trace is None or trace.origin != origin or trace.direction != direction or changes is None:
+            trace = NumericSolver.trace(origin, direction)
+        elif changes:
+            trace = NumericSolver.retrace(trace, changes)
+        self._trace, self._traced_changes = trace, traced_changes
+        return trace.path
+
     def first_intersection(self, obj) -> Point2D | None:
         if intersections := self.ray.intersection(obj):
             return Solver.nearest_to_origin(self.start_point, intersections)
@@ -52,3 +75,14 @@ class RayController:
     @property
     def angle_rad(self):
         return self.angle_deg * pi / 180.0
+
+    @property
+    def origin(self) -> Vec2:
+        """Float start point of the ray used by the numeric engine."""
+        return Vec2(float(self.start_point.x), float(self.start_point.y))
+
+    @property
+    def direction(self) -> Vec2:
+        """Unit direction vector of the ray used by the numeric engine."""
+        angle = radians(self.angle_deg)
+        return Vec2(cos(angle), sin(angle))
@@ -0,0 +1,72 @@
+from array import array
+from typing import Iterator
+
+import numpy as np
+
+
+class RayPath:
+    """
+    Traced segments of one ray and all of its children.
+
+    Segments are stored in a single contiguous float64 buffer, five values per segment:
+    start_x, start_y, end_x, end_y, alpha. Tracing appends to the buffer without creating
+    per-segment objects and `array()` exposes it to NumPy and the renderer without copying.
+    All children of a ray share its `wavelength` [nm], 0 for rays without one.
+    """
+    __slots__ = ("data", "wavelength")
+
+    FIELDS = 5
+
+    def __init__(self, data: array | None = None, wavelength: float = 0.0):
+        self.data = array("d") if data is None else data
+        self.wavelength = wavelength
+
+    def append(self, start_x: float, start_y: float, end_x: float, end_y: float, alpha: float):
+        self.data.extend((start_x, start_y, end_x, end_y, alpha))
+
+    def __len__(self) -> int:
+        return len(self.data) // RayPath.FIELDS
+
+    def __iter__(self) -> Iterator[tuple[float, float, float, float, float]]:
+        data = self.data
+        for i in range(0, len(data), RayPath.FIELDS):
+            yield data[i], data[i + 1], data[i + 2], data[i + 3], data[i + 4]
+
+    def segment(self, index: int) -> tuple[float, float, float, float, float]:
+        i = index * RayPath.FIELDS
+        return self.data[i], self.data[i + 1], self.data[i + 2], self.data[i + 3], self.data[i + 4]
+
+    def array(self) -> np.ndarray:
+        """
+        Returns a (k, 5) view of the buffer. While the view is alive the path can not grow.
+        """
+        return np.frombuffer(self.data, dtype=np.float64).reshape(-1, RayPath.FIELDS)
+
+    def prefix(self, count: int) -> 'RayPath':
+        """
+        Returns a copy of the first `count` segments.
+        """
+        return RayPath(self.data[:count * RayPath.FIELDS], self.wavelength)
+
+    def tolist(self) -> list[list[float]]:
+        return self.array().tolist()
+
+    @staticmethod
+    def from_array(segments: np.ndarray, wavelength: float = 0.0) -> 'RayPath':
+        """
+        Copies a (k, 5) array of segments into a path.
+        """
+        data = array("d")
+        data.frombytes(np.ascontiguousarray(segments, dtype=np.float64).tobytes())
+        return RayPath(data, wavelength)
+
+    @staticmethod
+    def from_dicts(path: list[dict]) -> 'RayPath':
+        """
+        Converts the `{"start", "end", "alpha_color"}` path dicts of `Solver` to a path.
+        """
+        result = RayPath()
+        for segment in path:
+            start, end = segment["start"], segment["end"]
+            result.append(float(start.x), float(start.y), float(end.x), float(end.y), float(segment["alpha_color"]))
+        return result
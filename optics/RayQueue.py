@@ -0,0 +1,72 @@
+import heapq
+import random
+from math import inf
+from time import perf_counter
+from typing import Any
+
+from conf import MIN_RAY_ALPHA, ROULETTE_ALPHA, TRACE_TIME_BUDGET
+from optics.TraceLog import TraceLog
+
+log = TraceLog.channel("queue")
+
+
+class RayQueue:
+    """
+    Rays of one ray tree waiting to be traced, brightest first.
+
+    Tracing the brightest pending ray first makes the most visible light come out first,
+    so whatever budget is left when the tree is cut off is spent on the dimmest branches.
+    Rays dimmer than `MIN_ALPHA` are never queued. Below `ROULETTE_ALPHA` rays play
+    Russian roulette: they survive with probability alpha / `ROULETTE_ALPHA` and continue
+    with alpha `ROULETTE_ALPHA`, which keeps the expected brightness of the tree.
+    """
+
+    # Rays dimmer than this alpha are not traced
+    MIN_ALPHA = MIN_RAY_ALPHA
+    # Rays dimmer than this alpha play Russian roulette, 0 disables it
+    ROULETTE_ALPHA = ROULETTE_ALPHA
+
+    def __init__(self, max_segments: int, time_budget: float = TRACE_TIME_BUDGET):
+        """
+        :param max_segments: Number of rays that may be taken from the queue
+        :param time_budget: Time [ms] the tree may be traced for, counted from now, 0 for no limit
+        """
+        self.heap = []
+        self.pushed = 0  # Tiebreaker keeping rays of equal alpha in the order they were queued
+        self.remaining = max_segments
+        self.deadline = perf_counter() + time_budget / 1000 if time_budget > 0 else inf
+        # Seeded, so tracing the same tree twice, or replaying it, draws the same paths
+        self.random = random.Random(0)
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def push(self, ray: Any, alpha: float) -> bool:
+        """
+        Queues a ray unless it is too dim or loses the Russian roulette.
+        :return: True when the ray was queued
+        """
+        if alpha < RayQueue.MIN_ALPHA:
+            if log.debug:
+                log.event("dim_ray_skipped", alpha=alpha)
+            return False
+        if alpha < RayQueue.ROULETTE_ALPHA:
+            if self.random.random() * RayQueue.ROULETTE_ALPHA >= alpha:
+                if log.debug:
+                    log.event("roulette_terminated", alpha=alpha)
+                return False
+            alpha = RayQueue.ROULETTE_ALPHA
+        heapq.heappush(self.heap, (-alpha, self.pushed, ray))
+        self.pushed += 1
+        return True
+
+    def pop(self) -> tuple[Any, float] | None:
+        """
+        Takes the brightest ray.
+        :return: The ray and its alpha, None when the queue is empty or the budget is used up
+        """
+        if not self.heap or self.remaining <= 0 or perf_counter() > self.deadline:
+            return None
+        self.remaining -= 1
+        negative_alpha, _, ray = heapq.heappop(self.heap)
+        return ray, -negative_alpha
@@ -0,0 +1,167 @@
+import json
+from math import radians, cos, sin
+from typing import Iterable, Iterator
+
+import numpy as np
+
+
+class SceneFile:
+    """
+    Reading and writing of scene files.
+
+    A scene is a sequence of flat records, one per object, e.g.
+    `{"type": "mirror", "x": 0, "y": 0, "width": 20, "height": 200, "rotation": 0}`.
+    Positions and rotations follow the graphic items: `x` and `y` are the item position
+    (top-left corner before rotation) and `rotation` is in degrees about the item center.
+
+    Supported formats, picked by the file extension:
+        - `.jsonl` - one JSON record per line, loaded and saved as a stream
+        - `.npz` - compact columnar format, one NumPy column per field and object type
+        - `.json` - a single object with `mirrors`, `lenses`, `prisms` and `lasers` lists
+    """
+
+    FORMAT = "light-simulator-scene"
+    VERSION = 1
+
+    # Fields and their default values for every object type, in column order
+    FIELDS = {
+        "mirror": {"x": 0.0, "y": 0.0, "width": 20.0, "height": 60.0, "rotation": 0.0,
+                   "refractive_index": 1.5, "absorption_coefficient": 0.001, "abbe_number": 0.0},
+        "lens": {"x": 0.0, "y": 0.0, "width": -1.0, "height": 100.0, "left_radius": 20.0, "right_radius": 20.0,
+                 "rotation": 0.0, "refractive_index": 1.5, "absorption_coefficient": 0.001, "abbe_number": 0.0},
+        "prism": {"x": 0.0, "y": 0.0, "side": 100.0, "rotation": 0.0,
+                  "refractive_index": 1.5, "absorption_coefficient": 0.001, "abbe_number": 0.0},
+        "laser": {"x": 0.0, "y": 0.0, "size": 50.0, "rotation": 0.0, "ray_count": 1, "beam_width": 0.0,
+                  "spread": 0.0, "wavelength": 0.0, "spectrum": 0},
+    }
+    # Fields added after the first version are appended, so `.npz` files with fewer columns get their defaults
+    # Plural keys of the `.json` layout
+    GROUPS = {"mirrors": "mirror", "lenses": "lens", "prisms": "prism", "lasers": "laser"}
+
+    @staticmethod
+    def normalize(record: dict) -> dict:
+        """
+        Fills missing fields with defaults and flattens a nested `material` object.
+        :raises ValueError: if the object type is unknown
+        """
+        if record.get("type") not in SceneFile.FIELDS:
+            raise ValueError(f"Unknown scene object type: {record.get('type')}")
+        record = dict(record)
+        record.update(record.pop("material", None) or {})
+        fields = SceneFile.FIELDS[record["type"]]
+        return {"type": record["type"], **{key: record.get(key, default) for key, default in fields.items()}}
+
+    @staticmethod
+    def read(path: str) -> Iterator[dict]:
+        """
+        Reads normalized records from a scene file.
+        :param path: Path to a `.jsonl`, `.npz` or `.json` file
+        """
+        if path.endswith(".npz"):
+            return SceneFile.read_columnar(path)
+        if path.endswith(".jsonl"):
+            return SceneFile.read_stream(path)
+        return SceneFile.read_json(path)
+
+    @staticmethod
+    def write(path: str, records: Iterable[dict]):
+        """
+        Writes records to a scene file, the format is picked by the extension like in `read`.
+        """
+        if path.endswith(".npz"):
+            SceneFile.write_columnar(path, records)
+        elif path.endswith(".jsonl"):
+            SceneFile.write_stream(path, records)
+        else:
+            SceneFile.write_json(path, records)
+
+    @staticmethod
+    def read_stream(path: str) -> Iterator[dict]:
+        with open(path) as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get("type") == "header":
+                    if record.get("version", SceneFile.VERSION) > SceneFile.VERSION:
+                        raise ValueError(f"Unsupported scene file version: {record['version']}")
+                    continue
+                yield SceneFile.normalize(record)
+
+    @staticmethod
+    def write_stream(path: str, records: Iterable[dict]):
+        with open(path, "w") as file:
+            file.write(json.dumps({"type": "header", "format": SceneFile.FORMAT, "version": SceneFile.VERSION}))
+            file.write("\n")
+            for record in records:
+                file.write(json.dumps(SceneFile.normalize(record)))
+                file.write("\n")
+
+    @staticmethod
+    def read_json(path: str) -> Iterator[dict]:
+        with open(path) as file:
+            scene = json.load(file)
+        for group, object_type in SceneFile.GROUPS.items():
+            for record in scene.get(group, []):
+                yield SceneFile.normalize({**record, "type": object_type})
+
+    @staticmethod
+    def write_json(path: str, records: Iterable[dict]):
+        scene = {"format": SceneFile.FORMAT, "version": SceneFile.VERSION, **{group: [] for group in SceneFile.GROUPS}}
+        groups = {object_type: group for group, object_type in SceneFile.GROUPS.items()}
+        for record in records:
+            record = SceneFile.normalize(record)
+            scene[groups[record.pop("type")]].append(record)
+        with open(path, "w") as file:
+            json.dump(scene, file, indent=2)
+
+    @staticmethod
+    def read_columnar(path: str) -> Iterator[dict]:
+        with np.load(path) as data:
+            columns = {key: data[key] for key in data.files}
+        for object_type, fields in SceneFile.FIELDS.items():
+            if object_type not in columns:
+                continue
+            for row in columns[object_type]:
+                record = {name: type(default)(value) for (name, default), value in zip(fields.items(), row)}
+                yield SceneFile.normalize({"type": object_type, **record})
+
+    @staticmethod
+    def write_columnar(path: str, records: Iterable[dict]):
+        rows = {object_type: [] for object_type in SceneFile.FIELDS}
+        for record in records:
+            record = SceneFile.normalize(record)
+            rows[record["type"]].append(tuple(record[key] for key in SceneFile.FIELDS[record["type"]]))
+        np.savez_compressed(path, **{object_type: np.array(table, dtype=float)
+                                     for object_type, table in rows.items() if table})
+
+    @staticmethod
+    def lens_width(record: dict) -> float:
+        """
+        Returns the lens width, a negative width means the sum of the absolute radii like in `Len`.
+        """
+        if record["width"] >= 0:
+            return record["width"]
+        return abs(record["left_radius"]) + abs(record["right_radius"])
+
+    @staticmethod
+    def item_center(record: dict) -> tuple[float, float]:
+        """
+        Calculates the center of an object in scene coordinates, the pivot of its rotation.
+        """
+        if record["type"] == "lens":
+            return record["x"] + SceneFile.lens_width(record) / 2, record["y"] + record["height"] / 2
+        if record["type"] == "laser":
+            return record["x"] + record["size"], record["y"] + record["size"] / 2
+        if record["type"] == "prism":
+            return record["x"] + record["side"] / 2, record["y"] + record["side"] * 3 ** 0.5 / 4
+        return record["x"] + record["width"] / 2, record["y"] + record["height"] / 2
+
+    @staticmethod
+    def laser_source(record: dict) -> tuple[float, float]:
+        """
+        Calculates the point a laser emits from, the middle of its right side rotated about its center.
+        """
+        center_x, center_y = SceneFile.item_center(record)
+        angle = radians(record["rotation"])
+        return center_x + record["size"] * cos(angle), center_y + record["size"] * sin(angle)
@@ -1,39 +1,254 @@
-from math import exp
+import threading
+from math import exp, sqrt
+from typing import Callable, NamedTuple
+
 from sympy import Point2D, Segment2D, Line2D, Ray, Ray2D, pi, cos, sin, solve, Eq, tan, asin
 from sympy.abc import x, y
 from sympy.geometry.entity import GeometrySet
 from conf import RAY_MAX_LENGTH, MAX_REFRACTIONS, IS_REFLECTION, IS_REFRACTION
 from optics.BasicController import BasicController
-from optics.util import round_point, round_ray, angle_to_ox, string_points
+from optics.BoundingVolumeHierarchy import BoundingVolumeHierarchy
+from optics.Material import Material
+from optics.Profiler import Profiler
+from optics.RayQueue import RayQueue
+from optics.TraceLog import TraceLog
+from optics.util import round_point, round_ray, angle_to_ox, Vec2
+
+log = TraceLog.channel("solver")
 
 
 class Solver:
     optical_objects: list[BasicController] = []
     lasers = []
+    bvh = BoundingVolumeHierarchy()
+    # Bounding boxes (before and after) of recent object changes, None when the bounds are unknown
+    changed_regions: list[tuple[float, float, float, float] | None] = []
+    # Number of changes dropped from the front of `changed_regions`
+    dropped_changes = 0
+    # Changes kept for retracing, rays that missed older changes are traced from scratch
+    MAX_CHANGED_REGIONS = 512
+    _changes_lock = threading.Lock()
+    _material_version = 0  # `Material.version` already recorded in `changed_regions`
+    # Threads tracing the live scene and the thread editing it, see `reading_scene` and `editing_scene`
+    _scene_condition = threading.Condition()
+    _scene_readers = 0
+    _scene_editor: int | None = None
+    _scene_edits = 0
     OX = Line2D(Point2D(0, 0), Point2D(1, 0))
 
+    class Interface(NamedTuple):
+        """
+        Terms of a hit that do not depend on the angle of incidence, memoized per material by `Solver.interface`.
+        """
+        squared_ratio: float  # (n1 / n2) ** 2 of the entered surface
+        squared_inverse_ratio: float  # (n2 / n1) ** 2 of the opposite surface, where the ray leaves the layer
+        absorption: float  # Fraction of light passing the layer unabsorbed
+
+    class SceneAccess:
+        """
+        Shared or exclusive access to the scene, see `Solver.reading_scene` and `Solver.editing_scene`.
+        """
+        __slots__ = ("editing",)
+
+        def __init__(self, editing: bool):
+            self.editing = editing
+
+        def __enter__(self):
+            condition = Solver._scene_condition
+            with condition:
+                if not self.editing:
+                    condition.wait_for(lambda: Solver._scene_editor is None)
+                    if Solver.bvh.is_stale(Solver.optical_objects):
+                        Solver.bvh.build(Solver.optical_objects)  # No other reader runs right after an edit
+                    Solver._scene_readers += 1
+                    return
+                thread = threading.get_ident()
+                if Solver._scene_editor != thread:
+                    condition.wait_for(lambda: Solver._scene_editor is None)
+                    Solver._scene_editor = thread  # Holds new readers back while the running ones finish
+                    condition.wait_for(lambda: Solver._scene_readers == 0)
+                Solver._scene_edits += 1
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            condition = Solver._scene_condition
+            with condition:
+                if not self.editing:
+                    Solver._scene_readers -= 1
+                else:
+                    Solver._scene_edits -= 1
+                    if Solver._scene_edits:  # Nested edit, the outermost one lets the readers in
+                        return False
+                    Solver._scene_editor = None
+                condition.notify_all()
+            return False
+
+    @staticmethod
+    def reading_scene() -> 'Solver.SceneAccess':
+        """
+        Returns a context manager for tracing the live scene off the GUI thread.
+        Waits for a running edit and keeps the scene from being edited until the trace is done.
+        Any number of threads can read at once.
+        """
+        return Solver.SceneAccess(False)
+
+    @staticmethod
+    def editing_scene() -> 'Solver.SceneAccess':
+        """
+        Returns a context manager for moving, adding or removing objects while other threads may trace.
+        Waits until no thread reads the scene, edits can be nested in the same thread.
+        """
+        return Solver.SceneAccess(True)
+
+    @staticmethod
+    def is_scene_read() -> bool:
+        """
+        Tells whether other threads trace the scene, so `editing_scene` would block.
+        """
+        with Solver._scene_condition:
+            return Solver._scene_readers > 0
+
+    @staticmethod
+    def add_object(obj: BasicController):
+        """
+        Adds an optical object to the scene, the bounding volume hierarchy is rebuilt on the next query.
+        """
+        with Solver.editing_scene():
+            Solver.optical_objects.append(obj)
+            Solver.bvh.invalidate()
+
+    @staticmethod
+    def remove_object(obj: BasicController):
+        """
+        Removes an optical object from the scene, the bounding volume hierarchy is rebuilt on the next query.
+        """
+        with Solver.editing_scene():
+            Solver.optical_objects.remove(obj)
+            Solver.bvh.invalidate()
+            with Solver._changes_lock:
+                Solver.record_changes(obj.bounds)
+
+    @staticmethod
+    def clear_objects():
+        """
+        Removes all optical objects from the scene.
+        """
+        with Solver.editing_scene():
+            Solver.optical_objects.clear()
+            Solver.bvh.invalidate()
+            with Solver._changes_lock:
+                Solver.record_changes(None)
+
+    @staticmethod
+    def object_changed(obj: BasicController, old_bounds: tuple[float, float, float, float] | None):
+        """
+        Registers that an object was moved or resized.
+        Refits the bounding volume hierarchy and records the old and new bounds of the object,
+        so traced paths crossing neither of them can be reused.
+        :param obj: The changed object
+        :param old_bounds: Bounds of the object before the change
+        """
+        Solver.bvh.refit(obj)
+        with Solver._changes_lock:
+            Solver.record_changes(old_bounds, obj.bounds)
+
+    @staticmethod
+    def record_changes(*regions: tuple[float, float, float, float] | None):
+        """
+        Appends changed regions to `changed_regions`, callers hold `_changes_lock`.
+        """
+        Solver.changed_regions.extend(regions)
+        if len(Solver.changed_regions) > Solver.MAX_CHANGED_REGIONS:
+            # Drop the older half at once, so trimming costs O(1) per change
+            dropped = len(Solver.changed_regions) - Solver.MAX_CHANGED_REGIONS // 2
+            del Solver.changed_regions[:dropped]
+            Solver.dropped_changes += dropped
+
+    @staticmethod
+    def changes_since(count: int) -> tuple[list[tuple[float, float, float, float] | None] | None, int]:
+        """
+        Returns the object changes registered after the first `count` ones.
+        Materials do not know the objects using them, so an edited material is recorded as an unknown region,
+        which forces a full trace.
+        :param count: Number of changes already applied, the second value of an earlier call
+        :return: The newer changes, None when some of them were already dropped, and the number of all changes
+        """
+        with Solver._changes_lock:
+            if Solver._material_version != Material.version:
+                Solver._material_version = Material.version
+                Solver.record_changes(None)
+            total = Solver.dropped_changes + len(Solver.changed_regions)
+            if count < Solver.dropped_changes:
+                return None, total
+            return Solver.changed_regions[count - Solver.dropped_changes:], total
+
     @staticmethod
-    def find_first_collision(ray: Ray2D) -> dict[str, Point2D | Segment2D] | None:
+    def scene_version() -> tuple[int, int]:
+        """
+        Returns the number of all object changes and the `Material.version`, they differ whenever the scene did.
+        Objects register their changes in `object_changed`, `remove_object` and `clear_objects`.
+        """
+        with Solver._changes_lock:
+            return Solver.dropped_changes + len(Solver.changed_regions), Material.version
+
+    @staticmethod
+    def candidate_objects(origin: Vec2, direction: Vec2) -> list[tuple[float, BasicController]]:
+        """
+        Finds optical objects whose bounding boxes are crossed by the ray.
+        Rebuilds the bounding volume hierarchy first when objects were added.
+        :param origin: The ray source point
+        :param direction: The direction vector of the ray
+        :return: List of (entry distance, object) sorted by the entry distance
+        """
+        if Solver.bvh.is_stale(Solver.optical_objects):
+            Solver.bvh.build(Solver.optical_objects)
+        return Solver.bvh.query(origin, direction)
+
+    @staticmethod
+    def medium_at(point: Vec2) -> BasicController | None:
+        """
+        Finds the object whose material contains the point.
+        Only objects whose bounding boxes contain the point are tested.
+        :return: The object or None when the point is in the air
+        """
+        if Solver.bvh.is_stale(Solver.optical_objects):
+            Solver.bvh.build(Solver.optical_objects)
+        for obj in Solver.bvh.objects_at(point):
+            if obj.is_point_inside(point):
+                return obj
+        return None
+
+    @staticmethod
+    def find_first_collision(ray: Ray2D, medium: BasicController | None = None) -> dict[str, Point2D | Segment2D] | None:
         """
         Detects the collision of a ray with optical objects.
         :param ray: The ray to check for collisions
         :type ray: Ray
+        :param medium: The object the ray travels in, None for the air
         """
-        print("first_collision called with ray:", ray)
-        collisions = []
-        for obj in Solver.optical_objects:
-            if collision_data := obj.get_collision(ray):
-                collisions.append(collision_data)
-        if collisions:
-            # Filter out collisions that are the same as the ray source
-            collisions = [cp for cp in collisions if round_point(cp["point"]) != round_point(ray.source)]
-            if not collisions:
-                print("No collisions found for ray:", ray)
-                return None
-            nearest = min(collisions, key=lambda cp: cp["point"].distance(round_point(ray.source)))
-            nearest["point"] = round_point(nearest["point"])
-            return nearest
-        return None
+        if log.debug:
+            log.event("find_first_collision", ray=ray)
+        with Profiler.stage("collision"):
+            collisions = []
+            origin = Vec2(float(ray.source.x), float(ray.source.y))
+            direction = Vec2(float(ray.direction.x), float(ray.direction.y))
+            candidates = Solver.candidate_objects(origin, direction)
+            Profiler.count("intersection_tests", len(candidates))
+            for _, obj in candidates:
+                if collision_data := obj.get_collision(ray):
+                    collisions.append(collision_data)
+            if collisions:
+                # Filter out collisions that are the same as the ray source
+                collisions = [cp for cp in collisions if round_point(cp["point"]) != round_point(ray.source)]
+                if not collisions:
+                    if log.debug:
+                        log.event("no_collision", ray=ray)
+                    return None
+                nearest = min(collisions, key=lambda cp: cp["point"].distance(round_point(ray.source)))
+                nearest["point"] = round_point(nearest["point"])
+                if "is-from-inside" not in nearest:
+                    nearest["is-from-inside"] = nearest["object"] is medium
+                return nearest
+            return None
 
     @staticmethod
     def nearest_to_origin(origin, objs):
@@ -60,7 +275,12 @@ class Solver:
         return sorted(objs, key=lambda obj: obj.distance(origin))
 
     @staticmethod
-    def get_path(ray: Ray2D) -> list[dict[str, Point2D]]:
+    def get_path(ray: Ray2D, cancelled: Callable[[], bool] | None = None) -> list[dict[str, Point2D]] | None:
+        """
+        Traces the ray and its reflected and refracted children, brightest first, see `RayQueue`.
+        :param ray: The initial ray
+        :param cancelled: Checked before every traced ray, tracing stops and returns None once it returns True
+        """
         collisions = []
 
         def compute_ray_reflection(incident_ray: Ray2D, collision_obj, alpha_primary) -> None | list:
@@ -81,7 +301,10 @@ class Solver:
                 n1 = 1
                 n2 = collision_obj["material"].refractive_index
             # Calculate the reflected ray's alpha color based on the refractive indices and absorption coefficient
-            alpha_color = alpha_primary -  Solver.calculate_alpha(alpha_primary, n1, n2, 0, 0, n2)
+            cos_incidence = float(cos(angle_to_ox(incident_ray) - normal_angle_to_ox))
+            _, surface_transmission = Solver.interface_factors(collision_obj["material"], n1, n2,
+                                                               collision_obj["thickness"], cos_incidence)
+            alpha_color = alpha_primary - alpha_primary * surface_transmission
             return [round_ray(new_ray), alpha_color]
 
         def compute_ray_refraction(incident_ray: Ray2D, collision_obj, alpha_primary: float) -> None | list:
@@ -97,15 +320,23 @@ class Solver:
             else:
                 n1 = 1
                 n2 = collision_obj["material"].refractive_index
+            angle_of_incident = ray_angle_to_ox - normal_angle_to_ox
+            if cos(angle_of_incident) < 0:  # Orient the normal along the ray, so the refracted ray crosses the surface
+                normal_angle_to_ox += pi
+                angle_of_incident -= pi
             # Calculate the absorption coefficient
-            alpha_color = Solver.calculate_alpha(alpha_primary, n1, n2, collision_obj["material"].absorption_coefficient, collision_obj["thickness"])
-            print(f"n1: {n1}, n2: {n2}, alpha_primary: {alpha_primary}, absorption_coefficient: {collision_obj['material'].absorption_coefficient}, thickness: {collision_obj['thickness']}")
-            print("alpha_color:", alpha_color)
+            transmission, _ = Solver.interface_factors(collision_obj["material"], n1, n2, collision_obj["thickness"],
+                                                       float(cos(angle_of_incident)))
+            alpha_color = alpha_primary * transmission
+            if log.debug:
+                log.event("refraction", n1=n1, n2=n2, alpha_primary=alpha_primary,
+                          absorption_coefficient=collision_obj['material'].absorption_coefficient,
+                          thickness=collision_obj['thickness'], alpha_color=alpha_color)
             # Using Snell's law to calculate the angle of refraction
-            angle_of_incident = ray_angle_to_ox - normal_angle_to_ox
             sin_beta = (n1 / n2) * sin(angle_of_incident)
             if abs(sin_beta) > 1:
-                print("Total internal reflection, returning None")
+                if log.debug:
+                    log.event("total_internal_reflection", ray=incident_ray)
                 return None
             # Calculate the angle of refraction
             beta_rad = asin(sin_beta)
@@ -115,34 +346,38 @@ class Solver:
                 collision_obj["point"] + Point2D(cos(new_ray_angle_to_ox), sin(new_ray_angle_to_ox)) * 2)
             new_ray = Ray2D(new_ray_source, angle=new_ray_angle_to_ox)
             return [round_ray(new_ray), alpha_color]
-        rays_fifo = [[ray, 255]] # Initial ray with alpha color 255
+        Profiler.count("rays")
+        queue = RayQueue(MAX_REFRACTIONS + 1)
+        # Every ray carries the object it travels in, so the medium is located only once per path
+        queue.push((ray, Solver.medium_at(Vec2(float(ray.source.x), float(ray.source.y)))), 255)  # Initial alpha 255
         i = 0
         while True:
             i += 1
-            print(f"Iteration {i}, ray: {ray}")
-            if len(rays_fifo) > 0:
-                ray, alpha = rays_fifo.pop(0)
-                if alpha < 5:
-                    print(f"Alpha {alpha} is too low, skipping ray: {ray}")
-                    continue
-                if collision := Solver.find_first_collision(ray):
-                    collisions.append({
-                        "start": round_point(ray.source),
-                        "end": round_point(collision["point"]),
-                        "alpha_color": alpha
-                    })
+            if log.debug:
+                log.event("iteration", iteration=i, ray=ray, queued=len(queue))
+            if cancelled is not None and cancelled():
+                return None
+            if (item := queue.pop()) is None:
+                break
+            (ray, medium), alpha = item
+            Profiler.count("bounces")
+            if collision := Solver.find_first_collision(ray, medium):
+                collisions.append({
+                    "start": round_point(ray.source),
+                    "end": round_point(collision["point"]),
+                    "alpha_color": alpha
+                })
+                with Profiler.stage("reflect_refract"):
                     if IS_REFLECTION and (result := compute_ray_reflection(ray, collision, alpha)):
-                        rays_fifo.append(result)
+                        queue.push((result[0], medium), result[1])
                     if IS_REFRACTION and (result := compute_ray_refraction(ray, collision, alpha)):
-                        rays_fifo.append(result)
+                        # The refracted ray leaves the object into the air or enters it
+                        queue.push((result[0], None if collision["is-from-inside"] else collision["object"]),
+                                   result[1])
 
-                else:
-                    collisions.append(
-                        {"start": round_point(ray.source), "end": round_point(Solver.get_ray_inf_point(ray)), "alpha_color": alpha})
             else:
-                break
-            if i > MAX_REFRACTIONS:
-                break
+                collisions.append(
+                    {"start": round_point(ray.source), "end": round_point(Solver.get_ray_inf_point(ray)), "alpha_color": alpha})
         return collisions
 
     @staticmethod
@@ -156,13 +391,14 @@ class Solver:
 
     @staticmethod
     def all_intersections(ray: Ray, obj) -> list[Point2D]:
-        print("obj: ", obj)
+        if log.debug:
+            log.event("all_intersections", ray=ray, obj=obj)
         if not isinstance(obj, GeometrySet):  # For Eq objects like Ellipse.equation()
             A, B, C = Line2D(*ray.points).coefficients
             line_eq = Eq(A * x + B * y + C, 0)
-            print("Line equation:", line_eq)
             points = Solver.solve_safe(line_eq, obj)
-            print("Solutions", string_points(points))
+            if log.debug:
+                log.event("solutions", line_equation=line_eq, points=points)
             return points
 
         if intersections := ray.intersection(obj):
@@ -213,9 +449,83 @@ class Solver:
         return Eq(-1 + (-pos_y - theta * (-pos_x + x) + y) ** 2 / (v_radius ** 2 * (theta ** 2 + 1)) + (
                 -pos_x + theta * (-pos_y + y) + x) ** 2 / (h_radius ** 2 * (theta ** 2 + 1)), 0)
 
+    @staticmethod
+    def interface_factors(material, n1: float, n2: float, thickness: float,
+                          cos_incidence: float = 1.0) -> tuple[float, float]:
+        """
+        Returns the alpha factors of a hit on a surface of the material.
+        The Fresnel terms are evaluated for the angle of incidence on top of the memoized terms, see `interface`.
+        :param material: Material of the hit object
+        :param n1: refractive index of the medium the ray comes from
+        :param n2: refractive index of the medium behind the surface
+        :param thickness: material layer thickness
+        :param cos_incidence: cosine of the angle between the ray and the surface normal
+        :return: (transmission, surface_transmission): the refracted ray keeps `alpha * transmission`,
+            the reflected one `alpha - alpha * surface_transmission`, see `calculate_alpha`
+        """
+        interface = Solver.interface(material, n1, n2, thickness)
+        r_input = Solver.fresnel_reflectance(n1, n2, cos_incidence, interface.squared_ratio)
+        if r_input >= 1:  # Total internal reflection, the reflected ray keeps everything
+            return 0.0, 0.0
+        r_output = Solver.fresnel_reflectance(n2, n1, Solver.cos_refraction(n1, n2, cos_incidence,
+                                                                            interface.squared_ratio),
+                                              interface.squared_inverse_ratio)
+        return Solver.layer_transmission(r_input, r_output, interface.absorption), 1 - r_input
+
+    @staticmethod
+    def interface(material, n1: float, n2: float, thickness: float) -> 'Solver.Interface':
+        """
+        Returns the angle independent terms of a hit on a surface of the material.
+        Memoized per material, keyed by (n1, n2, mu, thickness) and cleared by the material property setters.
+        """
+        key = (n1, n2, material.absorption_coefficient, thickness)
+        interface = material.interface_cache.get(key)
+        if interface is None:
+            interface = material.interface_cache[key] = Solver.Interface(
+                (n1 / n2) ** 2, (n2 / n1) ** 2, exp(-material.absorption_coefficient * thickness))
+        return interface
+
+    @staticmethod
+    def fresnel_reflectance(n1: float, n2: float, cos_incidence: float = 1.0,
+                            squared_ratio: float | None = None) -> float:
+        """
+        Reflectance of unpolarized light at an interface, the mean of the s and p polarized Fresnel equations.
+        At normal incidence it equals ((n2 - n1) / (n2 + n1)) ** 2.
+        :param n1: refractive index of the medium the ray comes from
+        :param n2: refractive index of the medium behind the interface
+        :param cos_incidence: cosine of the angle of incidence
+        :param squared_ratio: (n1 / n2) ** 2 when already known, see `interface`
+        :return: Reflected fraction of the energy, 1 on total internal reflection
+        """
+        cos_i = abs(cos_incidence)
+        sin_t2 = ((n1 / n2) ** 2 if squared_ratio is None else squared_ratio) * (1 - cos_i ** 2)
+        if sin_t2 >= 1:
+            return 1.0
+        cos_t = sqrt(1 - sin_t2)
+        r_s = (n1 * cos_i - n2 * cos_t) / (n1 * cos_i + n2 * cos_t)
+        r_p = (n2 * cos_i - n1 * cos_t) / (n2 * cos_i + n1 * cos_t)
+        return (r_s * r_s + r_p * r_p) / 2
+
+    @staticmethod
+    def cos_refraction(n1: float, n2: float, cos_incidence: float, squared_ratio: float | None = None) -> float:
+        """
+        Cosine of the angle of refraction by Snell's law, callers rule out total internal reflection.
+        """
+        squared_ratio = (n1 / n2) ** 2 if squared_ratio is None else squared_ratio
+        return sqrt(max(0.0, 1 - squared_ratio * (1 - cos_incidence ** 2)))
+
+    @staticmethod
+    def layer_transmission(r_input: float, r_output: float, absorption: float) -> float:
+        """
+        Transmission through a layer with multiple internal reflections between its two interfaces.
+        """
+        numerator = (1 - r_input) * (1 - r_output) * absorption
+        denominator = 1 - r_input * r_output * (absorption ** 2)
+        return numerator / denominator
+
     @staticmethod
     def calculate_alpha(alpha_initial: float, n1: float, n2: float, mu: float, thickness: float,
-                        n_output: float = None) -> float:
+                        n_output: float = None, cos_incidence: float = 1.0) -> float:
         """
         Calculates the final alpha value after passing through a material layer.
 
@@ -229,20 +539,20 @@ class Solver:
             (mu=0.1, thickness=15) is equivalent to (mu=10, thickness=0.15)
         :param thickness: material layer thickness
         :param n_output: refractive index of the output medium (default=n1)
+        :param cos_incidence: cosine of the angle of incidence (default=1, normal incidence)
         """
         if n_output is None:
             n_output = n1
 
-        # Reflection coefficients calculation
-        R_input = ((n2 - n1) / (n2 + n1)) ** 2
-        R_output = ((n_output - n2) / (n_output + n2)) ** 2
+        # Reflection coefficients calculation, the ray leaves the layer at the angle of refraction
+        R_input = Solver.fresnel_reflectance(n1, n2, cos_incidence)
+        if R_input >= 1:
+            return 0.0
+        R_output = Solver.fresnel_reflectance(n2, n_output, Solver.cos_refraction(n1, n2, cos_incidence))
 
         # Absorption calculation
         absorption = exp(-mu * thickness)
 
         # Full transmission model with multiple reflections
-        numerator = (1 - R_input) * (1 - R_output) * absorption
-        denominator = 1 - R_input * R_output * (absorption ** 2)
-
-        total_transmission = numerator / denominator
+        total_transmission = Solver.layer_transmission(R_input, R_output, absorption)
         return alpha_initial * total_transmission
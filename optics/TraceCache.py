@@ -0,0 +1,191 @@
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+
+from conf import (TRACE_CACHE_SIZE, TRACE_CACHE_DIR, TRACE_TIME_BUDGET, MAX_REFRACTIONS, MIN_RAY_ALPHA,
+                  ROULETTE_ALPHA, RAY_MAX_LENGTH, IS_REFLECTION, IS_REFRACTION)
+from optics.RayPath import RayPath
+from optics.TraceLog import TraceLog
+
+log = TraceLog.channel("cache")
+
+
+class TraceCache:
+    """
+    Least recently used cache of traced laser paths, addressed by the content of the traced scene.
+
+    The key of a job is a hash of its engine, ray origins, directions and wavelengths, the geometry
+    and materials of all optical objects (see `ParallelSolver.scene_snapshot`) and the tracing limits
+    of `conf.py`. Toggling an object back and forth, or reopening a scene, hits the paths traced before.
+    Entries are evicted by their memory size once `MAX_BYTES` is exceeded. With `DIRECTORY` set they
+    are also written to disk and survive restarts.
+    Traces cut off by `TRACE_TIME_BUDGET` depend on the timing and are never cached.
+    """
+
+    # Bump when the key or the file layout changes, so stale files on disk are not hit
+    VERSION = 1
+    # Estimated size [bytes] of a `RayPath` besides its segments
+    PATH_OVERHEAD = 120
+
+    MAX_BYTES = TRACE_CACHE_SIZE * 1024 * 1024
+    DIRECTORY = TRACE_CACHE_DIR
+
+    _entries: OrderedDict[str, tuple[list[RayPath], int]] = OrderedDict()  # key -> paths and their size
+    _bytes = 0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def enabled() -> bool:
+        return TraceCache.MAX_BYTES > 0 and TRACE_TIME_BUDGET <= 0
+
+    @staticmethod
+    def key(job: tuple, snapshot: list[dict]) -> str | None:
+        """
+        Calculates the content address of a `ParallelSolver` job.
+        :param job: Tuple (engine, origins, directions) with optional wavelengths
+        :param snapshot: Optical objects of the scene, see `ParallelSolver.scene_snapshot`
+        :return: Hex digest, None when the cache is disabled
+        """
+        if not TraceCache.enabled():
+            return None
+        engine, origins, directions, *rest = job
+        wavelengths = rest[0] if rest else None
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(json.dumps([TraceCache.VERSION, engine, MAX_REFRACTIONS, MIN_RAY_ALPHA, ROULETTE_ALPHA,
+                                  RAY_MAX_LENGTH, IS_REFLECTION, IS_REFRACTION, snapshot], default=float).encode())
+        for values in (origins, directions, wavelengths if wavelengths is not None else ()):
+            digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+            digest.update(b"|")
+        return digest.hexdigest()
+
+    @staticmethod
+    def get(key: str | None) -> list[RayPath] | None:
+        """
+        Looks up the paths of a key in memory and then on disk.
+        :return: Paths of every ray of the job, None on a miss
+        """
+        if key is None:
+            return None
+        with TraceCache._lock:
+            if (entry := TraceCache._entries.get(key)) is not None:
+                TraceCache._entries.move_to_end(key)
+                if log.debug:
+                    log.event("hit", key=key)
+                return entry[0]
+        paths = TraceCache.load(key)
+        if paths is not None:
+            TraceCache.store(key, paths)
+            if log.debug:
+                log.event("disk_hit", key=key)
+        return paths
+
+    @staticmethod
+    def put(key: str | None, paths: list[RayPath]):
+        """
+        Caches the paths of a key in memory and, with `DIRECTORY` set, on disk.
+        """
+        if key is None:
+            return
+        TraceCache.store(key, paths)
+        if TraceCache.DIRECTORY:
+            TraceCache.save(key, paths)
+
+    @staticmethod
+    def store(key: str, paths: list[RayPath]):
+        """
+        Adds paths to the memory cache, evicting the least recently used entries above `MAX_BYTES`.
+        """
+        size = sum(len(path.data) * path.data.itemsize + TraceCache.PATH_OVERHEAD for path in paths)
+        if size > TraceCache.MAX_BYTES:
+            return
+        with TraceCache._lock:
+            if (entry := TraceCache._entries.pop(key, None)) is not None:
+                TraceCache._bytes -= entry[1]
+            TraceCache._entries[key] = (paths, size)
+            TraceCache._bytes += size
+            while TraceCache._bytes > TraceCache.MAX_BYTES:
+                evicted, (_, evicted_size) = TraceCache._entries.popitem(last=False)
+                TraceCache._bytes -= evicted_size
+                if log.debug:
+                    log.event("evicted", key=evicted, size=evicted_size)
+
+    @staticmethod
+    def wrap(key: str | None, task: Callable[..., list | None],
+             unchanged: Callable[[], bool]) -> Callable[..., list | None]:
+        """
+        Wraps a trace task of a ray item, so it returns cached paths without tracing
+        and caches the paths it traces.
+        The key is built when the task is created, but the task may run later against the live scene.
+        Paths of cancelled tasks, or traced after the scene changed, are returned but not cached.
+        :param key: Content address of the task, see `key`
+        :param task: Trace task taking an optional `cancelled` callback
+        :param unchanged: Tells whether the scene is still the one the key was built from, see `Solver.scene_version`
+        """
+        if key is None:
+            return task
+
+        def cached_task(cancelled: Callable[[], bool] | None = None) -> list | None:
+            paths = TraceCache.get(key)
+            if paths is None:
+                paths = task(cancelled)
+                if paths is not None and not (cancelled is not None and cancelled()) and unchanged():
+                    TraceCache.put(key, paths)
+            return paths
+        return cached_task
+
+    @staticmethod
+    def clear():
+        """
+        Empties the memory cache, files on disk are kept.
+        """
+        with TraceCache._lock:
+            TraceCache._entries.clear()
+            TraceCache._bytes = 0
+
+    @staticmethod
+    def path(key: str) -> str:
+        return os.path.join(TraceCache.DIRECTORY, key[:2], f"{key}.npz")
+
+    @staticmethod
+    def load(key: str) -> list[RayPath] | None:
+        """
+        Reads the paths of a key from disk.
+        :return: Paths, None when the file is missing or unreadable
+        """
+        if not TraceCache.DIRECTORY:
+            return None
+        try:
+            with np.load(TraceCache.path(key)) as data:
+                segments, counts, wavelengths = data["segments"], data["counts"], data["wavelengths"]
+        except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):  # Missing, truncated or corrupt
+            return None
+        return [RayPath.from_array(rows, wavelength) for rows, wavelength
+                in zip(np.split(segments, np.cumsum(counts)[:-1]), wavelengths.tolist())]
+
+    @staticmethod
+    def save(key: str, paths: list[RayPath]):
+        """
+        Writes the paths of a key to disk. The file is renamed into place, so readers never see a partial file.
+        """
+        file_path = TraceCache.path(key)
+        temporary = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(temporary, "wb") as file:
+                np.savez(file, segments=np.concatenate([path.array() for path in paths] or
+                                                       [np.empty((0, RayPath.FIELDS))]),
+                         counts=np.array([len(path) for path in paths], dtype=np.int64),
+                         wavelengths=np.array([path.wavelength for path in paths], dtype=float))
+            os.replace(temporary, file_path)
+        except OSError as error:
+            if log.warning:
+                log.event("write_failed", TraceLog.WARNING, key=key, error=repr(error))
+            with contextlib.suppress(OSError):
+                os.remove(temporary)
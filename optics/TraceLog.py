@@ -0,0 +1,133 @@
+import json
+from collections import deque
+from time import perf_counter
+
+from conf import TRACE_LOG, TRACE_LOG_FILE, TRACE_LOG_SIZE
+
+
+class TraceLog:
+    """
+    Structured debug channel of the solvers, a replacement of `print` in hot paths.
+
+    Every module owns a named channel with its own level. Hot loops guard events with a plain attribute check,
+    so a disabled channel costs a single attribute load::
+
+        log = TraceLog.channel("solver")
+        ...
+        if log.debug:
+            log.event("bounce", TraceLog.DEBUG, ray=ray, alpha=alpha)
+
+    Events are kept as (time, channel, level, name, fields) tuples in a bounded ring buffer, the fields are not
+    formatted until the buffer is dumped, so even SymPy geometry costs only a reference while tracing.
+    Optionally every event is also appended to a JSON Lines file.
+
+    Levels are configured with `TRACE_LOG` in `conf.txt`, e.g. `solver=debug,lens=info` or `*=debug`.
+    """
+
+    DEBUG = 10
+    INFO = 20
+    WARNING = 30
+    OFF = 100
+    LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "off": OFF}
+
+    class Channel:
+        __slots__ = ("name", "level", "debug", "info", "warning")
+
+        def __init__(self, name: str, level: int):
+            self.name = name
+            self.set_level(level)
+
+        def set_level(self, level: int):
+            self.level = level
+            # Precomputed flags keep the disabled check down to an attribute load
+            self.debug = level <= TraceLog.DEBUG
+            self.info = level <= TraceLog.INFO
+            self.warning = level <= TraceLog.WARNING
+
+        def event(self, name: str, level: int | None = None, **fields):
+            """
+            Records an event, callers check the level flag first.
+            :param name: Short event name, e.g. "bounce"
+            :param level: One of `TraceLog.DEBUG` (default), `TraceLog.INFO`, `TraceLog.WARNING`
+            :param fields: Event data, formatted only when dumped
+            """
+            level = TraceLog.DEBUG if level is None else level
+            if level < self.level:
+                return
+            record = (perf_counter(), self.name, level, name, fields)
+            TraceLog.buffer.append(record)
+            if TraceLog._file is not None:
+                TraceLog._file.write(TraceLog.format(record))
+                TraceLog._file.write("\n")
+
+    channels: dict[str, Channel] = {}
+    default_level = OFF
+    buffer: deque = deque(maxlen=10000)
+    _file = None
+    _levels: dict[str, int] = {}
+
+    @staticmethod
+    def channel(name: str) -> 'TraceLog.Channel':
+        """
+        Returns the channel of a module, creating it with the configured level.
+        """
+        if name not in TraceLog.channels:
+            TraceLog.channels[name] = TraceLog.Channel(name, TraceLog._levels.get(name, TraceLog.default_level))
+        return TraceLog.channels[name]
+
+    @staticmethod
+    def configure(spec: str = "", path: str = "", size: int | None = None):
+        """
+        Sets channel levels and sinks.
+        :param spec: Comma separated `channel=level` pairs, `*` sets the level of all other channels
+        :param path: JSON Lines file receiving every event, empty keeps events in the ring buffer only
+        :param size: Capacity of the ring buffer
+        :raises ValueError: if a level is unknown
+        """
+        levels = {}
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            name, _, level = item.partition("=")
+            if level.strip().lower() not in TraceLog.LEVELS:
+                raise ValueError(f"Unknown trace log level: {level}")
+            levels[name.strip()] = TraceLog.LEVELS[level.strip().lower()]
+        TraceLog.default_level = levels.pop("*", TraceLog.OFF)
+        TraceLog._levels = levels
+        for name, channel in TraceLog.channels.items():
+            channel.set_level(levels.get(name, TraceLog.default_level))
+        if size is not None:
+            TraceLog.buffer = deque(TraceLog.buffer, maxlen=size)
+        if TraceLog._file is not None:
+            TraceLog._file.close()
+        TraceLog._file = open(path, "a") if path else None
+
+    @staticmethod
+    def records(channel: str | None = None) -> list[tuple]:
+        """
+        Returns buffered events, optionally of a single channel.
+        """
+        return [record for record in TraceLog.buffer if channel is None or record[1] == channel]
+
+    @staticmethod
+    def format(record: tuple) -> str:
+        """
+        Formats an event as a JSON object, values JSON does not know are converted with `str`.
+        """
+        time, channel, level, name, fields = record
+        return json.dumps({"time": time, "channel": channel, "level": level, "event": name, **fields}, default=str)
+
+    @staticmethod
+    def dump(path: str):
+        """
+        Writes the ring buffer to a JSON Lines file for offline analysis.
+        """
+        with open(path, "w") as file:
+            for record in TraceLog.buffer:
+                file.write(TraceLog.format(record))
+                file.write("\n")
+
+    @staticmethod
+    def clear():
+        TraceLog.buffer.clear()
+
+
+TraceLog.configure(TRACE_LOG, TRACE_LOG_FILE, TRACE_LOG_SIZE)
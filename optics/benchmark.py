@@ -0,0 +1,201 @@
+"""
+Benchmarks of the optics solvers.
+
+Traces parametrized synthetic scenes with every engine, times the collision and alpha helpers,
+records time and peak memory per scenario and appends the results to a JSON history file::
+
+    python -m optics.benchmark -o benchmarks.json
+
+Each run is compared with the previous run of the history, the command fails when a benchmark
+got slower than `--threshold` allows, so regressions are caught before a release.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tracemalloc
+from datetime import datetime, timezone
+from math import cos, sin, atan2, degrees
+from time import perf_counter
+from typing import Callable
+
+from sympy import Ray2D
+
+import optics.BatchSolver
+import optics.NumericSolver
+import optics.Solver
+from optics.LenController import LenController
+from optics.MirrorController import MirrorController
+from optics.SceneFile import SceneFile
+from optics.Solver import Solver
+from optics.run import ENGINES, build_scene, trace_laser
+from optics.util import Vec2, vec2point
+
+# Synthetic scenes: number of mirrors, lenses and lasers, and the bounce limit
+SCENARIOS = [
+    {"mirrors": 5, "lenses": 0, "lasers": 1, "max_refractions": 10},
+    {"mirrors": 10, "lenses": 2, "lasers": 4, "max_refractions": 10},
+    {"mirrors": 10, "lenses": 2, "lasers": 4, "max_refractions": 30},
+    {"mirrors": 100, "lenses": 5, "lasers": 16, "max_refractions": 10},
+]
+SCENE_SIZE = 1000
+MODULES_WITH_MAX_REFRACTIONS = (optics.Solver, optics.NumericSolver, optics.BatchSolver)
+
+
+def scene_records(mirrors: int, lenses: int, lasers: int, seed: int = 0) -> list[dict]:
+    """
+    Generates a reproducible random scene, lasers point at the scene center.
+    """
+    rng = random.Random(seed)
+    records = []
+    for _ in range(mirrors):
+        records.append(SceneFile.normalize({"type": "mirror", "x": rng.uniform(0, SCENE_SIZE),
+                                            "y": rng.uniform(0, SCENE_SIZE), "width": 20, "height": 80,
+                                            "rotation": rng.uniform(0, 180)}))
+    for _ in range(lenses):
+        records.append(SceneFile.normalize({"type": "lens", "x": rng.uniform(0, SCENE_SIZE),
+                                            "y": rng.uniform(0, SCENE_SIZE), "height": 100}))
+    for _ in range(lasers):
+        x, y = rng.uniform(0, SCENE_SIZE), rng.uniform(0, SCENE_SIZE)
+        rotation = degrees(atan2(SCENE_SIZE / 2 - y, SCENE_SIZE / 2 - x)) + rng.uniform(-20, 20)
+        records.append(SceneFile.normalize({"type": "laser", "x": x, "y": y, "rotation": rotation}))
+    return records
+
+
+def set_max_refractions(value: int):
+    for module in MODULES_WITH_MAX_REFRACTIONS:
+        module.MAX_REFRACTIONS = value
+
+
+def measure(function: Callable, min_time: float, max_repeats: int) -> dict:
+    """
+    Times repeated calls until `min_time` seconds or `max_repeats` calls are reached,
+    then measures the peak memory of one more call.
+    :return: Dict with `min`, `mean` [s], `repeats` and `peak_memory` [B]
+    """
+    times = []
+    while len(times) < max_repeats and sum(times) < min_time:
+        started = perf_counter()
+        function()
+        times.append(perf_counter() - started)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"min": min(times), "mean": sum(times) / len(times), "repeats": len(times), "peak_memory": peak}
+
+
+def run_scenario(scenario: dict, engines: list[str], min_time: float, max_repeats: int) -> list[dict]:
+    """
+    Builds the scene of a scenario and runs all benchmarks on it.
+    """
+    Solver.clear_objects()
+    set_max_refractions(scenario["max_refractions"])
+    lasers = build_scene(scene_records(scenario["mirrors"], scenario["lenses"], scenario["lasers"]))
+    results = []
+
+    def record(benchmark: str, engine: str | None, function: Callable):
+        results.append({"benchmark": benchmark, "engine": engine, "scenario": scenario,
+                        **measure(function, min_time, max_repeats)})
+
+    for engine in engines:
+        record("get_path", engine, lambda: [trace_laser(laser, engine) for laser in lasers])
+
+    # Rays from the first laser source aimed at the center of the first mirror and lens
+    origin = Vec2(*SceneFile.laser_source(lasers[0])) if lasers else Vec2(0, 0)
+    for controller_type, benchmark in ((MirrorController, "mirror_collision"), (LenController, "lens_collision")):
+        if target := next((obj for obj in Solver.optical_objects if isinstance(obj, controller_type)), None):
+            angle = atan2(float(target.pos.y) - origin.y, float(target.pos.x) - origin.x)
+            direction = Vec2(cos(angle), sin(angle))
+            ray = Ray2D(vec2point(origin), angle=angle)
+            if "sympy" in engines:
+                record(benchmark, "sympy", lambda: target.get_collision(ray))
+            if "numeric" in engines or "batch" in engines:
+                record(benchmark, "numeric", lambda: target.get_numeric_collision(origin, direction))
+
+    record("calculate_alpha", None, lambda: [Solver.calculate_alpha(255, 1, 1.5, 0.001, 0.2 + i / 100, 1)
+                                             for i in range(1000)])
+    return results
+
+
+def result_key(result: dict) -> str:
+    return json.dumps([result["benchmark"], result["engine"], result["scenario"]], sort_keys=True)
+
+
+def compare(previous: dict | None, results: list[dict], threshold: float) -> list[str]:
+    """
+    Prints the change of every benchmark against the previous run.
+    :return: Keys of benchmarks slower than `1 + threshold` times the previous run
+    """
+    before = {result_key(result): result for result in previous["results"]} if previous else {}
+    regressions = []
+    for result in results:
+        key = result_key(result)
+        change = ""
+        if old := before.get(key):
+            ratio = result["min"] / old["min"] if old["min"] else 1
+            change = f"{ratio - 1:+.1%}"
+            if ratio > 1 + threshold:
+                regressions.append(key)
+                change += " REGRESSION"
+        scenario = result["scenario"]
+        print(f"{result['benchmark']:<17} {result['engine'] or '-':<8} "
+              f"m={scenario['mirrors']:<4} l={scenario['lenses']:<3} k={scenario['lasers']:<3} "
+              f"r={scenario['max_refractions']:<3} {result['min'] * 1000:>10.3f} ms "
+              f"{result['peak_memory'] / 1024:>9.1f} KiB {change}")
+    return regressions
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="python -m optics.benchmark", description="Benchmark the optics solvers.")
+    parser.add_argument("-o", "--output", default="benchmarks.json", help="JSON history file (default: %(default)s)")
+    parser.add_argument("-e", "--engines", nargs="+", choices=ENGINES, default=list(ENGINES),
+                        help="Engines to benchmark (default: all)")
+    parser.add_argument("-s", "--scenarios", type=int, nargs="+",
+                        help=f"Indices of the scenarios to run (default: all {len(SCENARIOS)})")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimal time [s] per benchmark")
+    parser.add_argument("--repeat", type=int, default=20, help="Maximal repeats per benchmark")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed slowdown against the previous run (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    scenarios = [SCENARIOS[i] for i in args.scenarios] if args.scenarios else SCENARIOS
+    results = []
+    with contextlib.redirect_stdout(sys.stderr):  # Keep debug prints out of the report
+        for scenario in scenarios:
+            results.extend(run_scenario(scenario, args.engines, args.min_time, args.repeat))
+
+    history = []
+    if os.path.exists(args.output):
+        with open(args.output) as file:
+            history = json.load(file)
+    regressions = compare(history[-1] if history else None, results, args.threshold)
+    history.append({
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    })
+    with open(args.output, "w") as file:
+        json.dump(history, file, indent=1)
+    if regressions:
+        sys.exit(f"{len(regressions)} benchmark(s) slower than the previous run by more than {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Headless batch simulation.
+
+Builds the optical objects described in a scene file, traces every laser and writes
+the path segments as JSON or CSV, without Qt::
+
+    python -m optics.run scene.jsonl -o paths.csv
+
+See `optics.SceneFile` for the supported scene formats.
+"""
+import argparse
+import contextlib
+import csv
+import json
+import sys
+from math import cos, sin, radians
+from typing import Iterable
+
+from conf import SOLVER_ENGINE, PARALLEL_WORKERS
+from optics.BatchSolver import BatchSolver
+from optics.LenController import LenController
+from optics.MirrorController import MirrorController
+from optics.ParallelSolver import ParallelSolver
+from optics.Profiler import Profiler
+from optics.RayPath import RayPath
+from optics.PrizmController import PrizmController
+from optics.SceneFile import SceneFile
+
+ENGINES = ("sympy", "numeric", "batch")
+CSV_HEADER = ("laser", "ray", "segment", "start_x", "start_y", "end_x", "end_y", "alpha", "wavelength")
+
+
+def build_scene(records: Iterable[dict]) -> list[dict]:
+    """
+    Creates controllers for all mirrors, lenses and prisms of the scene.
+    :param records: Normalized scene records, see `SceneFile`
+    :return: Laser records of the scene
+    """
+    lasers = []
+    for record in records:
+        if record["type"] == "laser":
+            lasers.append(record)
+            continue
+        x, y = SceneFile.item_center(record)
+        if record["type"] == "mirror":
+            controller = MirrorController(x, y, record["width"], record["height"])
+            controller.rotation = record["rotation"]
+            controller.update_props()
+        elif record["type"] == "lens":
+            controller = LenController(x, y, SceneFile.lens_width(record), record["height"], record["left_radius"],
+                                       record["right_radius"])
+            if record["rotation"]:
+                controller.rotation = record["rotation"]
+        else:
+            controller = PrizmController(x, y, record["side"], record["rotation"])
+        if material := getattr(controller, "material", None):
+            material.refractive_index = record["refractive_index"]
+            material.absorption_coefficient = record["absorption_coefficient"]
+            material.abbe_number = record["abbe_number"]
+    return lasers
+
+
+def laser_job(laser: dict, engine: str) -> tuple[str, list, list, list | None]:
+    """
+    Describes all rays of a laser as a `ParallelSolver` job.
+    Only the batch engine traces dispersion, so beams with more than one ray and lasers with a wavelength
+    always use it. A white laser emits every ray once per sampled wavelength.
+
+    :param laser: Laser record from the scene file
+    :param engine: One of `ENGINES`
+    :return: Engine, origins, directions and wavelengths of the rays (None without a wavelength)
+    """
+    origin = SceneFile.laser_source(laser)
+    rotation = laser["rotation"]
+    wavelengths = BatchSolver.spectrum(laser["wavelength"], laser["spectrum"])
+    if engine == "batch" or laser["ray_count"] > 1 or wavelengths is not None:
+        origins, directions = BatchSolver.emit_rays(origin, rotation, laser["ray_count"], laser["beam_width"],
+                                                    laser["spread"])
+        return "batch", *BatchSolver.emit_spectrum(origins, directions, wavelengths)
+    return engine, [origin], [(cos(radians(rotation)), sin(radians(rotation)))], None
+
+
+def trace_laser(laser: dict, engine: str) -> list[RayPath]:
+    """
+    Traces all rays of a laser.
+    :param laser: Laser record from the scene file
+    :param engine: One of `ENGINES`, see `laser_job`
+    :return: Segments of every ray
+    """
+    engine, origins, directions, wavelengths = laser_job(laser, engine)
+    return ParallelSolver.trace_job(engine, origins, directions, wavelengths=wavelengths)
+
+
+def write_json(results: list, engine: str, file):
+    json.dump({"engine": engine, "lasers": [{"rays": [path.tolist() for path in rays],
+                                             "wavelengths": [path.wavelength for path in rays]}
+                                            for rays in results]}, file)
+    file.write("\n")
+
+
+def write_csv(results: list, file):
+    writer = csv.writer(file)
+    writer.writerow(CSV_HEADER)
+    for laser_index, rays in enumerate(results):
+        for ray_index, segments in enumerate(rays):
+            for segment_index, segment in enumerate(segments):
+                writer.writerow((laser_index, ray_index, segment_index, *segment, segments.wavelength))
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="python -m optics.run", description="Trace a scene without the GUI.")
+    parser.add_argument("scene", help="Scene file (.jsonl, .npz or .json)")
+    parser.add_argument("-o", "--output", help="Output file, standard output when omitted")
+    parser.add_argument("-f", "--format", choices=("json", "csv"),
+                        help="Output format, guessed from the output extension by default (json)")
+    parser.add_argument("-j", "--jobs", type=int, default=PARALLEL_WORKERS,
+                        help="Worker processes tracing lasers in parallel, 0 traces serially "
+                             "(default: PARALLEL_WORKERS from conf.txt)")
+    parser.add_argument("-e", "--engine", choices=ENGINES,
+                        default=SOLVER_ENGINE if SOLVER_ENGINE in ENGINES else "numeric",
+                        help="Tracing engine (default: SOLVER_ENGINE from conf.txt)")
+    parser.add_argument("--profile", metavar="TRACE_JSON",
+                        help="Write per-stage timings as a Chrome trace (chrome://tracing, Perfetto), "
+                             "worker processes of --jobs are not profiled")
+    args = parser.parse_args(argv)
+    if args.profile:
+        Profiler.enabled = True
+
+    output_format = args.format or ("csv" if args.output and args.output.endswith(".csv") else "json")
+    # Keep debug prints of the engine out of the results written to standard output
+    with contextlib.redirect_stdout(sys.stderr):
+        lasers = build_scene(SceneFile.read(args.scene))
+        if args.jobs > 0 and len(lasers) > 1:
+            results = ParallelSolver.trace([laser_job(laser, args.engine) for laser in lasers], args.jobs)
+            ParallelSolver.shutdown()
+        else:
+            results = [trace_laser(laser, args.engine) for laser in lasers]
+    if args.profile:
+        Profiler.export_chrome_trace(args.profile)
+
+    with open(args.output, "w", newline="") if args.output else contextlib.nullcontext(sys.stdout) as file:
+        if output_format == "csv":
+            write_csv(results, file)
+        else:
+            write_json(results, args.engine, file)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,26 @@
 
-from PyQt6.QtCore import QPointF
-from sympy import N, pi, Point2D, Ray as SympyRay, Line2D, Segment2D, atan2
+from math import sqrt
+from typing import NamedTuple
+
+try:
+    from PyQt6.QtCore import QPointF
+except ImportError:  # Headless mode, the optics engine works without Qt
+    class QPointF:
+        """Placeholder so `isinstance` checks against `QPointF` keep working without Qt."""
+from sympy import N, pi, Point2D, Rational, Ray as SympyRay, Line2D, Segment2D, atan2
 
 from conf import ROUNDING_PRECISION
 
 
+class Vec2(NamedTuple):
+    """
+    Plain float 2D point/vector used by the numeric engine.
+    Exposes `x` and `y` attributes like `Point2D`, so path dicts stay interchangeable.
+    """
+    x: float
+    y: float
+
+
 def is_point_inside_polygon(point, polygon):
     """
     The Winding Number algorithm determines whether a point lies inside a polygon by calculating how many times the polygon winds around the point.
@@ -30,6 +46,26 @@ def is_point_inside_polygon(point, polygon):
     return wn != 0
 
 
+def is_point_inside_convex_polygon(point, polygon, tolerance: float = 0.0) -> bool:
+    """
+    Checks whether a point lies inside a convex polygon or on its boundary.
+    The point is inside when it lies on the same side of every edge. Points closer than
+    `tolerance` to the line of an edge count as lying on it.
+    """
+    x, y = point
+    inside_left = inside_right = True
+    for i in range(len(polygon)):
+        x1, y1 = polygon[i]
+        x2, y2 = polygon[(i + 1) % len(polygon)]
+        length = sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
+        if not length:
+            continue
+        distance = ((x2 - x1) * (y - y1) - (x - x1) * (y2 - y1)) / length
+        inside_left &= distance >= -tolerance
+        inside_right &= distance <= tolerance
+    return inside_left or inside_right
+
+
 def round_and_float(value):
     return round(float(value), ROUNDING_PRECISION)
 
@@ -45,6 +81,14 @@ def round_point(point: Point2D | QPointF) -> Point2D | QPointF:
         return QPointF(round_and_float(point.x()), round_and_float(point.y()))
     return Point2D(round_and_float(point.x), round_and_float(point.y))
 
+def vec2point(vec: Vec2) -> Point2D:
+    """
+    Converts a float vector to a rounded `Point2D`.
+    Builds the rational coordinates directly, which is much cheaper than passing floats to `Point2D`.
+    """
+    scale = 10 ** ROUNDING_PRECISION
+    return Point2D(Rational(round(vec.x * scale), scale), Rational(round(vec.y * scale), scale))
+
 def round_ray(ray: SympyRay):
     return SympyRay(round_point(ray.source), round_point(ray.p2))
 
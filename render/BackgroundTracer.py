@@ -0,0 +1,131 @@
+import threading
+import traceback
+from time import perf_counter
+from typing import Callable
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+
+from graphic.items import RayGraphicItem
+from optics.ParallelSolver import ParallelSolver
+from optics.Solver import Solver
+from optics.TraceCache import TraceCache
+from optics.TraceLog import TraceLog
+
+log = TraceLog.channel("background")
+
+
+class TraceJob(QRunnable):
+    """
+    Traces one ray item on a pool thread and reports the segments through `BackgroundTracer.finished`.
+    The scene is read under `Solver.reading_scene`, so it cannot be edited while the job traces it.
+    Always reports back, with None as the result when cancelled or failed.
+    """
+
+    def __init__(self, item: RayGraphicItem, task: Callable[..., list | None], tracer: 'BackgroundTracer'):
+        super().__init__()
+        self.setAutoDelete(False)  # Kept alive by the tracer until its result is delivered
+        self.item = item
+        self.task = task
+        self.tracer = tracer
+        self.duration = 0.0  # Time spent tracing [ms]
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def run(self):
+        paths = None
+        started = perf_counter()
+        try:
+            if not self.is_cancelled():
+                with Solver.reading_scene():
+                    paths = self.task(self.is_cancelled)
+        except Exception as error:  # An exception escaping a pool thread would abort the application
+            if log.warning:
+                log.event("trace_failed", TraceLog.WARNING, error=repr(error), traceback=traceback.format_exc())
+        finally:
+            self.duration = (perf_counter() - started) * 1000
+            self.tracer.finished.emit(self, None if self.is_cancelled() else paths)
+
+
+class BackgroundTracer(QObject):
+    """
+    Traces rays on a `QThreadPool` so the GUI thread stays responsive.
+
+    Everything a job needs from Qt (source point, angle, beam rays) is captured on the GUI thread
+    by `trace_task()` of the ray item, the pool thread only runs the Qt-free solver on the live scene.
+    Edits of the scene wait for running jobs in `Solver.editing_scene`, see `RecalcScheduler.flush`.
+    Submitting an item again cancels its previous job: a queued job is taken off the pool,
+    a running one stops at the next ray of the FIFO and its result is discarded.
+    Results arrive through the `finished` signal, which Qt delivers on the GUI thread.
+    """
+
+    finished = pyqtSignal(object, object)  # TraceJob, segments of every ray or None
+
+    _instance: 'BackgroundTracer | None' = None
+
+    @staticmethod
+    def instance() -> 'BackgroundTracer':
+        if BackgroundTracer._instance is None:
+            BackgroundTracer._instance = BackgroundTracer()
+        return BackgroundTracer._instance
+
+    def __init__(self):
+        super().__init__()
+        self.pool = QThreadPool.globalInstance()
+        self._jobs: dict[int, TraceJob] = {}  # id(item) -> latest job of the item
+        self._alive: set[TraceJob] = set()  # Started jobs, referenced until they finish
+        self.finished.connect(self._deliver)
+
+    def submit(self, items: list[RayGraphicItem], preview: bool = False) -> list[TraceJob]:
+        """
+        Starts tracing the items in the background, replacing their pending jobs.
+        :param items: Ray items to trace
+        :param preview: Trace a cheaper approximation, see `trace_task` of the ray items
+        :return: Started jobs
+        """
+        snapshot = ParallelSolver.scene_snapshot() if TraceCache.enabled() else None  # Cache key of every job
+        jobs = []
+        for item in items:
+            self.cancel(item)
+            job = TraceJob(item, item.trace_task(preview, snapshot), self)
+            self._jobs[id(item)] = job
+            self._alive.add(job)
+            self.pool.start(job)
+            jobs.append(job)
+        return jobs
+
+    def cancel(self, item: RayGraphicItem):
+        if job := self._jobs.pop(id(item), None):
+            job.cancel()
+            if self.pool.tryTake(job):  # Never started, report it like a job cancelled while running
+                self.finished.emit(job, None)
+
+    def cancel_all(self) -> list[RayGraphicItem]:
+        """
+        Cancels all pending jobs, so the scene can be edited without waiting for them to finish.
+        :return: Items of the cancelled jobs, they still need tracing
+        """
+        items = [job.item for job in self._jobs.values()]
+        for item in items:
+            self.cancel(item)
+        return items
+
+    def is_busy(self) -> bool:
+        return bool(self._jobs)
+
+    @pyqtSlot(object, object)
+    def _deliver(self, job: TraceJob, paths: list | None):
+        self._alive.discard(job)
+        if self._jobs.get(id(job.item)) is not job:
+            return  # Cancelled or superseded by a newer job of the same item
+        del self._jobs[id(job.item)]
+        if paths is None:
+            return
+        try:
+            job.item.set_path_segments(paths)
+        except RuntimeError:  # The item was removed from the scene meanwhile
+            pass
@@ -0,0 +1,69 @@
+from functools import partial
+from typing import Callable
+
+import numpy as np
+from PyQt6.QtCore import QPointF
+
+from graphic.ZoomableView import ZoomableView
+from graphic.items import RayGraphicItem
+from optics.BatchSolver import BatchSolver
+from optics.ParallelSolver import ParallelSolver
+from optics.Solver import Solver
+from optics.TraceCache import TraceCache
+
+
+class Beam(RayGraphicItem):
+    """
+    A bundle of rays emitted by a laser and traced together by `BatchSolver`.
+    Rays are spread evenly across `width` (a wide beam) and/or across `spread` degrees (a fan).
+    A beam with `wavelengths` emits every ray once per wavelength and all of them are traced as one batch.
+    """
+
+    # Number of rays traced for a preview while the scene is being edited
+    PREVIEW_RAYS = 16
+
+    def __init__(self, start_point: QPointF, view: ZoomableView, parent=None, ray_count: int = 2,
+                 width: float = 0, spread: float = 0, wavelengths: np.ndarray | None = None):
+        super().__init__(start_point, view, parent)
+        self.ray_count = ray_count
+        self.width = width
+        self.spread = spread
+        self.wavelengths = wavelengths  # Emitted wavelengths, see `BatchSolver.spectrum`
+
+    def update_props(self):
+        self.calc()
+
+    def sync(self):
+        pass  # The beam rays are emitted from the current source point when traced
+
+    def emit_rays(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Calculates source points and unit directions of all rays in the beam.
+        :return: Arrays (N, 2) of origins and directions
+        """
+        return BatchSolver.emit_rays((self.start_point.x(), self.start_point.y()), self.angle_deg, self.ray_count,
+                                     self.width, self.spread)
+
+    def trace_task(self, preview: bool = False, snapshot: list[dict] | None = None) -> Callable[..., list | None]:
+        """
+        Captures the beam rays and returns a function tracing them without touching Qt,
+        or returning their paths from `TraceCache`.
+        :param preview: Trace at most `PREVIEW_RAYS` evenly picked rays
+        :param snapshot: Current `ParallelSolver.scene_snapshot`, shared by all items traced at once
+        """
+        origins, directions = self.emit_rays()
+        if preview and self.ray_count > Beam.PREVIEW_RAYS:
+            picked = np.linspace(0, self.ray_count - 1, Beam.PREVIEW_RAYS).round().astype(int)
+            origins, directions = origins[picked], directions[picked]
+        origins, directions, wavelengths = BatchSolver.emit_spectrum(origins, directions, self.wavelengths)
+        task = partial(ParallelSolver.trace_job, "batch", origins, directions, wavelengths=wavelengths)
+        if not TraceCache.enabled():
+            return task
+        if snapshot is None:
+            snapshot = ParallelSolver.scene_snapshot()
+        version = Solver.scene_version()
+        key = TraceCache.key(("batch", origins, directions, wavelengths), snapshot)
+        return TraceCache.wrap(key, task, lambda: Solver.scene_version() == version)
+
+    def calc(self):
+        self.set_path_segments(self.trace_task()())
@@ -1,45 +1,68 @@
 from typing import Any
-from PyQt6.QtCore import QPointF, QTimer
+from PyQt6.QtCore import QPointF
 from PyQt6.QtGui import QBrush, QColor
 from PyQt6.QtWidgets import QGraphicsItem
-from conf import REFRESH_LASER_TIMEOUT
 from graphic.ZoomableView import ZoomableView
 from graphic.items import RectangleItem
+from optics.BatchSolver import BatchSolver
 from optics.Solver import Solver
+from render.Beam import Beam
 from render.Ray import Ray
+from render.RecalcScheduler import RecalcScheduler
 
 
 class Laser(RectangleItem):
-    _all_timer_active = False
 
     @staticmethod
     def recalc_all():
-        if not Laser._all_timer_active:
-            Laser._all_timer_active = True
-            for laser in Solver.lasers:
-                QTimer.singleShot(REFRESH_LASER_TIMEOUT, lambda: ([ray.calc() for ray in laser.rays],
-                                                                  setattr(Laser, '_all_timer_active', False)))
+        """
+        Schedules retracing the rays of all lasers, see `RecalcScheduler`.
+        """
+        RecalcScheduler.instance().recalc_all()
 
-    def __init__(self, x: float, y: float, size: float, view: ZoomableView):
+    @staticmethod
+    def calc_all():
+        """
+        Traces the rays of all lasers right away.
+        """
+        RecalcScheduler.instance().trace([ray for laser in Solver.lasers for ray in laser.rays])
+
+    def __init__(self, x: float, y: float, size: float, view: ZoomableView, ray_count: int = 1,
+                 beam_width: float = 0, spread: float = 0, wavelength: float = 0, spectrum: int = 0):
         super().__init__(x, y, size * 2, size, view)
         self.setBrush(QBrush(QColor("purple")))
         self.setZValue(2)
-        self.rays = [
-            Ray(self.source_point, view, self),
-        ]
+        self.ray_count = ray_count
+        self.beam_width = beam_width
+        self.spread = spread
+        self.wavelength = wavelength
+        self.spectrum = spectrum
+        wavelengths = BatchSolver.spectrum(wavelength, spectrum)
+        # Only the batch engine traces dispersion, so lasers with a wavelength are beams even with a single ray
+        if ray_count > 1 or wavelengths is not None:
+            self.rays = [
+                Beam(self.source_point, view, self, ray_count, beam_width, spread, wavelengths),
+            ]
+        else:
+            self.rays = [
+                Ray(self.source_point, view, self),
+            ]
         Solver.lasers.append(self)
-        self._timer_active = False
         view.scene().addItem(self)
 
     def itemChange(self, change: QGraphicsItem.GraphicsItemChange, value: Any) -> Any:
         if change == QGraphicsItem.GraphicsItemChange.ItemPositionChange or change == QGraphicsItem.GraphicsItemChange.ItemRotationChange:
-            if not self._timer_active:
-                self._timer_active = True
-                QTimer.singleShot(REFRESH_LASER_TIMEOUT, lambda: ([ray.update_props() for ray in self.rays],
-                                                                  setattr(self, '_timer_active', False)))
+            RecalcScheduler.instance().item_changed(self)
+        elif change == QGraphicsItem.GraphicsItemChange.ItemPositionHasChanged or change == QGraphicsItem.GraphicsItemChange.ItemRotationHasChanged:
+            for ray in getattr(self, "rays", []):  # Rays are created after the first position is set
+                ray.invalidate_geometry()
 
         return super().itemChange(change, value)
 
+    def sync(self):
+        for ray in self.rays:
+            ray.sync()
+
     @property
     def source_point(self):
         right_center_local = QPointF(self.rect().right(), self.rect().center().y())
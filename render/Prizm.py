@@ -1,11 +1,28 @@
-from sympy import sqrt
+from math import sqrt
+from typing import Any
+
+from PyQt6.QtWidgets import QGraphicsItem
 
 from graphic.ZoomableView import ZoomableView
 from graphic.items import TriangleItem
 from optics.PrizmController import PrizmController
+from render.RecalcScheduler import RecalcScheduler
 
 
 class Prizm(TriangleItem):
     def __init__(self, x: float, y: float, side: float, view: ZoomableView):
         super().__init__(x, y, side, (side * sqrt(3)) / 2, view)
-        self.controller = PrizmController(x, y, self.vertices)
+        self.controller = PrizmController(self.center_pos().x(), self.center_pos().y(), side)
+
+        view.scene().addItem(self)
+
+    def itemChange(self, change: QGraphicsItem.GraphicsItemChange, value: Any) -> Any:
+        if change == QGraphicsItem.GraphicsItemChange.ItemPositionChange or change == QGraphicsItem.GraphicsItemChange.ItemRotationChange:
+            RecalcScheduler.instance().item_changed(self)
+
+        return super().itemChange(change, value)
+
+    def sync(self):
+        self.controller.pos = self.center_pos()
+        self.controller.rotation = self.rotation()
+        self.controller.update_props()
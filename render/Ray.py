@@ -1,9 +1,16 @@
+from typing import Callable
+
 from PyQt6.QtCore import QPointF
 
+from conf import SOLVER_ENGINE
 from graphic.ZoomableView import ZoomableView
 from graphic.items import RayGraphicItem
+from optics.ParallelSolver import ParallelSolver
+from optics.Profiler import Profiler
 from optics.RayController import RayController
+from optics.RayPath import RayPath
 from optics.Solver import Solver
+from optics.TraceCache import TraceCache
 
 
 class Ray(RayGraphicItem):
@@ -16,12 +23,46 @@ class Ray(RayGraphicItem):
         super().__del__()
 
     def update_props(self):
-        self.controller.update_props(self.start_point, self.angle_deg)
+        self.sync()
         self.calc()
 
+    def sync(self):
+        """
+        Copies the current source point and angle of the item to the controller.
+        """
+        self.controller.update_props(self.start_point, self.angle_deg)
+
+    def trace_job(self) -> tuple[str, list, list]:
+        """
+        Describes the ray to trace as a `ParallelSolver` job.
+        """
+        engine = "numeric" if SOLVER_ENGINE == "numeric" else "sympy"
+        return engine, [self.controller.origin], [self.controller.direction]
+
+    def trace_task(self, preview: bool = False, snapshot: list[dict] | None = None) -> Callable[..., list | None]:
+        """
+        Captures the ray and returns a function tracing it, or returning its paths from `TraceCache`.
+        The function does not touch Qt, so it can run on a worker thread, see `BackgroundTracer`.
+        :param preview: Use the fast numeric engine regardless of `SOLVER_ENGINE`
+        :param snapshot: Current `ParallelSolver.scene_snapshot`, shared by all items traced at once
+        """
+        controller, ray = self.controller, self.controller.ray
+
+        def task(cancelled: Callable[[], bool] | None = None) -> list | None:
+            with Profiler.stage("trace"):
+                if SOLVER_ENGINE == "numeric" or preview:
+                    return [controller.get_numeric_path()]
+                path = Solver.get_path(ray, cancelled)
+                return None if path is None else [RayPath.from_dicts(path)]
+
+        if not TraceCache.enabled():
+            return task
+        if snapshot is None:
+            snapshot = ParallelSolver.scene_snapshot()
+        version = Solver.scene_version()
+        engine, origins, directions = self.trace_job()
+        key = TraceCache.key(("numeric" if preview else engine, origins, directions), snapshot)
+        return TraceCache.wrap(key, task, lambda: Solver.scene_version() == version)
+
     def calc(self):
-        path = Solver.get_path(self.controller.ray)
-        self.path_points = []
-        for i, data, in enumerate(path):
-            self.path_points.append({"start": QPointF(data["start"].x, data["start"].y), "end": QPointF(data["end"].x, data["end"].y), "alpha_color": int(data["alpha_color"])})
-        self.rerender()
+        self.set_path_segments(self.trace_task()())
@@ -0,0 +1,160 @@
+from time import perf_counter
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSlot
+
+from conf import FRAME_BUDGET, MAX_REFRESH_INTERVAL, BACKGROUND_TRACING
+from optics.BasicController import BasicController
+from optics.ParallelSolver import ParallelSolver
+from optics.Profiler import Profiler
+from optics.Solver import Solver
+from optics.TraceCache import TraceCache
+from render.BackgroundTracer import BackgroundTracer, TraceJob
+
+
+class RecalcScheduler(QObject):
+    """
+    Coalesces change notifications of all items into as few recalculations as the scene can afford.
+
+    Items report moves and rotations with `item_changed`; the scheduler syncs their controllers and
+    retraces once per refresh. The refresh interval follows the measured cost of recent traces:
+    while a trace fits in `FRAME_BUDGET` the scene is retraced on the next event loop pass,
+    otherwise at most every `cost` ms. Scenes too expensive for the budget are traced as a cheap
+    preview while the user interacts, and refined with full quality once changes settle
+    for `MAX_REFRESH_INTERVAL` ms.
+    """
+
+    # Weight of the newest measurement in the smoothed trace costs
+    SMOOTHING = 0.3
+
+    _instance: 'RecalcScheduler | None' = None
+
+    @staticmethod
+    def instance() -> 'RecalcScheduler':
+        if RecalcScheduler._instance is None:
+            RecalcScheduler._instance = RecalcScheduler()
+        return RecalcScheduler._instance
+
+    def __init__(self):
+        super().__init__()
+        self.cost = 0.0  # Smoothed cost of a full quality recalculation [ms]
+        self.preview_cost = 0.0  # Smoothed cost of a preview recalculation [ms]
+        self._items = {}  # id(item) -> item changed since the last refresh
+        self._cancelled = {}  # id(ray) -> ray item whose background job was cancelled before a sync
+        self._all = False
+        self._waiting = False  # A sync waits for cancelled background jobs to stop reading the scene
+        self._flush_cost = 0.0  # Time spent on the GUI thread by the last refresh [ms]
+        self._jobs: dict[TraceJob, bool] = {}  # Background jobs of the last refreshes -> is preview
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+        self._refine_timer = QTimer(self)
+        self._refine_timer.setSingleShot(True)
+        self._refine_timer.timeout.connect(self.refine)
+        BackgroundTracer.instance().finished.connect(self._job_finished)
+
+    def item_changed(self, item):
+        """
+        Schedules syncing the controller of a moved or rotated item and retracing the affected rays.
+        Lasers retrace only their own rays, optical objects retrace all lasers.
+        """
+        self._items[id(item)] = item
+        self._schedule()
+
+    def recalc_all(self):
+        """
+        Schedules retracing the rays of all lasers.
+        """
+        self._all = True
+        self._schedule()
+
+    def is_preview(self) -> bool:
+        return self.cost > FRAME_BUDGET
+
+    def interval(self) -> int:
+        """
+        Delay of the next refresh [ms], zero while the expected trace cost fits in the frame budget.
+        """
+        expected = self.preview_cost if self.is_preview() else self.cost
+        if expected <= FRAME_BUDGET:
+            return 0
+        return int(min(expected, MAX_REFRESH_INTERVAL))
+
+    def _schedule(self):
+        if not self._timer.isActive():
+            self._timer.start(self.interval())
+
+    @pyqtSlot()
+    def flush(self):
+        """
+        Syncs all changed items and retraces the affected rays.
+        While cancelled background jobs still trace the scene, the sync is postponed until they report back,
+        so the GUI thread never waits for a trace.
+        """
+        started = perf_counter()
+        if self._items and BACKGROUND_TRACING:
+            # Background jobs trace the live scene, cancel them instead of waiting for their stale results
+            for ray in BackgroundTracer.instance().cancel_all():
+                self._cancelled[id(ray)] = ray
+            if Solver.is_scene_read():  # Cancelled jobs stop at their next ray, sync once they report back
+                self._waiting = True
+                return
+        self._waiting = False
+        items, self._items = list(self._items.values()), {}
+        cancelled, self._cancelled = list(self._cancelled.values()), {}
+        rays = []
+        with Solver.editing_scene():
+            for item in items:
+                with Profiler.stage("update_props"):
+                    item.sync()
+                rays.extend(getattr(item, "rays", []))
+        if self._all or any(isinstance(getattr(item, "controller", None), BasicController) for item in items):
+            # An optical object changed, it may be in the way of any laser
+            rays = [ray for laser in Solver.lasers for ray in laser.rays]
+        else:
+            traced = {id(ray) for ray in rays}
+            rays.extend(ray for ray in cancelled if id(ray) not in traced)
+        self._all = False
+        preview = self.is_preview()
+        self.trace(rays, preview)
+        self._flush_cost = (perf_counter() - started) * 1000
+        if not BACKGROUND_TRACING:
+            self._measure(self._flush_cost, preview)
+        if preview:
+            self._refine_timer.start(MAX_REFRESH_INTERVAL)
+
+    @pyqtSlot()
+    def refine(self):
+        """
+        Retraces all lasers with full quality after previews.
+        """
+        self.trace([ray for laser in Solver.lasers for ray in laser.rays], False)
+
+    def trace(self, rays: list, preview: bool = False):
+        """
+        Traces ray items on a background thread when `BACKGROUND_TRACING` is on and on the GUI thread otherwise.
+        Worker processes (`PARALLEL_WORKERS`) are left to the headless `optics.run`, waiting for them would
+        block the GUI thread for the whole trace.
+        :param rays: Ray items to trace
+        :param preview: Trace a cheaper approximation, see `trace_task` of the ray items
+        """
+        if BACKGROUND_TRACING:
+            for job in BackgroundTracer.instance().submit(rays, preview):
+                self._jobs[job] = preview
+        else:
+            snapshot = ParallelSolver.scene_snapshot() if TraceCache.enabled() else None  # Cache key of every ray
+            for ray in rays:
+                ray.set_path_segments(ray.trace_task(preview, snapshot)())
+
+    @pyqtSlot(object, object)
+    def _job_finished(self, job: TraceJob, paths: list | None):
+        preview = self._jobs.pop(job, None)
+        if preview is not None and paths is not None:
+            self._measure(self._flush_cost + job.duration, preview)
+        if self._waiting and not Solver.is_scene_read():
+            self._schedule()
+
+    def _measure(self, cost: float, preview: bool):
+        if preview:
+            self.preview_cost += RecalcScheduler.SMOOTHING * (cost - self.preview_cost)
+        else:
+            self.cost += RecalcScheduler.SMOOTHING * (cost - self.cost)
@@ -0,0 +1,89 @@
+from typing import Iterable, Iterator
+
+from PyQt6.QtWidgets import QGraphicsScene
+
+from graphic.ZoomableView import ZoomableView
+from optics.SceneFile import SceneFile
+from render.Laser import Laser
+from render.Len import Len
+from render.Mirror import Mirror
+from render.Prizm import Prizm
+
+
+def create_item(record: dict, view: ZoomableView):
+    """
+    Creates the graphic item (and its controller) described by a normalized scene record.
+    """
+    if record["type"] == "mirror":
+        item = Mirror(record["x"], record["y"], record["width"], record["height"], view)
+    elif record["type"] == "lens":
+        item = Len(record["x"], record["y"], record["height"], view, record["left_radius"], record["right_radius"],
+                   record["width"])
+    elif record["type"] == "prism":
+        item = Prizm(record["x"], record["y"], record["side"], view)
+    else:
+        return Laser(record["x"], record["y"], record["size"], view, record["ray_count"], record["beam_width"],
+                     record["spread"], record["wavelength"], record["spectrum"])
+    if material := getattr(item.controller, "material", None):
+        material.refractive_index = record["refractive_index"]
+        material.absorption_coefficient = record["absorption_coefficient"]
+        material.abbe_number = record["abbe_number"]
+    return item
+
+
+def load_scene(path: str, view: ZoomableView) -> list:
+    """
+    Loads all objects of a scene file into the view.
+    Qt has no batched `addItem`, so scene indexing and view updates are suspended while the items
+    are inserted and the index is built once at the end.
+
+    :return: Created items
+    """
+    scene = view.scene()
+    index_method = scene.itemIndexMethod()
+    scene.setItemIndexMethod(QGraphicsScene.ItemIndexMethod.NoIndex)
+    view.setUpdatesEnabled(False)
+    try:
+        items = []
+        for record in SceneFile.read(path):
+            item = create_item(record, view)
+            if record["rotation"]:
+                item.setRotation(record["rotation"])
+            items.append(item)
+    finally:
+        scene.setItemIndexMethod(index_method)
+        view.setUpdatesEnabled(True)
+    Laser.recalc_all()
+    return items
+
+
+def scene_records(view: ZoomableView) -> Iterator[dict]:
+    """
+    Describes all optical objects and lasers of the view as scene records.
+    """
+    for item in view.scene().items():
+        if isinstance(item, Mirror):
+            record = {"type": "mirror", "width": item.width, "height": item.height}
+        elif isinstance(item, Len):
+            record = {"type": "lens", "width": item.width, "height": item.height, "left_radius": item.left_radius,
+                      "right_radius": item.right_radius}
+        elif isinstance(item, Prizm):
+            record = {"type": "prism", "side": item.width}
+        elif isinstance(item, Laser):
+            record = {"type": "laser", "size": item.height, "ray_count": item.ray_count,
+                      "beam_width": item.beam_width, "spread": item.spread, "wavelength": item.wavelength,
+                      "spectrum": item.spectrum}
+        else:
+            continue
+        record.update(x=item.pos().x(), y=item.pos().y(), rotation=item.rotation())
+        if material := getattr(getattr(item, "controller", None), "material", None):
+            record.update(refractive_index=material.refractive_index,
+                          absorption_coefficient=material.absorption_coefficient, abbe_number=material.abbe_number)
+        yield record
+
+
+def save_scene(path: str, view: ZoomableView, records: Iterable[dict] | None = None):
+    """
+    Saves the objects of the view to a scene file, streaming records as they are collected.
+    """
+    SceneFile.write(path, scene_records(view) if records is None else records)